@@ -0,0 +1,370 @@
+"""Banc de charge hors ligne pour server.py.
+
+Exemples:
+    python bench.py seed --db bench.db --users 100000 --transactions 50000000
+    python bench.py run --db bench.db --concurrency 16 --requests 2000 --output run.json
+    python bench.py run --url http://localhost:5000 --phones-from bench.db --output run.json
+    python bench.py compare avant.json apres.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+PHONE_BASE = 22670000000
+SEED_BATCH_SIZE = 50000
+INCOME_SOURCES = ['Salaire', 'Commerce', 'Transfert', 'Dépôt Orange Money']
+EXPENSE_CATEGORIES = ['Alimentation', 'Transport', 'Loyer', 'Santé', 'Éducation', 'Transfert']
+
+
+# Clé entière du numéro (voir server.phone_key); phone_number stocke la forme +226XXXXXXXX
+def phone_key_for(index):
+    return PHONE_BASE + index
+
+
+def phone_for(index):
+    return f'+{phone_key_for(index)}'
+
+
+def load_server(db_path):
+    # server lit SAVEUP_DB à l'import
+    if db_path:
+        os.environ['SAVEUP_DB'] = db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    return server
+
+
+# Remplissage de la base synthétique
+
+def seed(args):
+    if os.path.exists(args.db) and not args.append:
+        print(f'{args.db} existe déjà (utilisez --append pour compléter)', file=sys.stderr)
+        return 1
+
+    server = load_server(args.db)
+    server.init_db()
+    server.close_db()
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(args.db)
+    # Durabilité inutile pendant le remplissage
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+
+    start = time.perf_counter()
+    first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+    for offset in range(0, args.users, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, args.users - offset)
+        conn.executemany(
+            'INSERT INTO users (phone_number, phone_key, name) VALUES (?, ?, ?)',
+            ((phone_for(first + offset + i), phone_key_for(first + offset + i), f'Utilisateur {first + offset + i}')
+             for i in range(count))
+        )
+        conn.commit()
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+    print(f'{args.users} utilisateur(s) en {time.perf_counter() - start:.1f}s')
+
+    start = time.perf_counter()
+    origin = datetime.now() - timedelta(days=args.days)
+    span = args.days * 86400
+
+    def transaction_rows(count):
+        for _ in range(count):
+            # Deux tiers de revenus pour garder des soldes positifs
+            if rng.random() < 0.66:
+                kind, category, amount = 'income', rng.choice(INCOME_SOURCES), rng.randint(500, 100000)
+            else:
+                kind, category, amount = 'expense', rng.choice(EXPENSE_CATEGORIES), rng.randint(100, 40000)
+            date = origin + timedelta(seconds=rng.randrange(span))
+            yield (rng.choice(user_ids), kind, amount, category, '', date.strftime('%Y-%m-%d %H:%M:%S.%f'))
+
+    for offset in range(0, args.transactions, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, args.transactions - offset)
+        conn.executemany(
+            'INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, ?, ?, ?, ?, ?)',
+            transaction_rows(count)
+        )
+        conn.commit()
+        if offset and offset % (SEED_BATCH_SIZE * 20) == 0:
+            print(f'  {offset} transactions...')
+    print(f'{args.transactions} transaction(s) en {time.perf_counter() - start:.1f}s')
+
+    conn.executemany(
+        'INSERT INTO deposit_requests (phone_number, phone_key, amount, transaction_proof, status) VALUES (?, ?, ?, ?, ?)',
+        ((phone_for(index), phone_key_for(index), rng.randint(1000, 50000), f'OM{i}',
+          rng.choice(['pending', 'approved', 'rejected'])) for i, index in enumerate(rng.randrange(args.users) for _ in range(args.requests)))
+    )
+    conn.executemany(
+        'INSERT INTO withdraw_requests (user_id, amount, transaction_proof, status) VALUES (?, ?, ?, ?)',
+        ((rng.choice(user_ids), rng.randint(100, 1000), '',
+          rng.choice(['pending', 'approved', 'rejected'])) for _ in range(args.requests))
+    )
+    conn.commit()
+    conn.close()
+
+    # Les soldes matérialisés et les agrégats de /stats sont recalculés en une passe
+    drifts = server.rebuild_balances(fix=True)
+    db = server.get_db()
+    db.execute('BEGIN IMMEDIATE')
+    server.rebuild_rollups(db.cursor())
+    db.commit()
+    server.close_db()
+    print(f'{len(drifts)} solde(s) initialisé(s), agrégats recalculés')
+    return 0
+
+
+# Scénarios de charge
+
+# Scénarios de traitement par lot: {route: file de demandes}
+ADMIN_BATCH_ROUTES = {'admin_deposits_batch': 'deposits', 'admin_withdraws_batch': 'withdraws'}
+
+
+def seed_pending_requests(db_path, kind, count):
+    """Crée jusqu'à count demandes en attente et renvoie leurs identifiants.
+
+    Un retrait en attente réserve son montant (balances.held), comme /request_withdraw.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        ids = []
+        if kind == 'deposits':
+            users = conn.execute('SELECT phone_number, phone_key FROM users ORDER BY random() LIMIT ?', (count,)).fetchall()
+            for i in range(count):
+                phone_number, key = users[i % len(users)]
+                ids.append(conn.execute(
+                    "INSERT INTO deposit_requests (phone_number, phone_key, amount, transaction_proof) VALUES (?, ?, 1000, ?)",
+                    (phone_number, key, f'BENCH{i}')
+                ).lastrowid)
+        else:
+            users = conn.execute(
+                'SELECT user_id, balance - held FROM balances WHERE balance - held > 0 ORDER BY random()').fetchall()
+            for user_id, available in users:
+                for _ in range(min(available, count - len(ids))):
+                    ids.append(conn.execute(
+                        "INSERT INTO withdraw_requests (user_id, amount, transaction_proof) VALUES (?, 1, '')", (user_id,)
+                    ).lastrowid)
+                    conn.execute('UPDATE balances SET held = held + 1 WHERE user_id = ?', (user_id,))
+                if len(ids) == count:
+                    break
+        conn.commit()
+        return ids
+    finally:
+        conn.close()
+
+
+def scenarios(phones, pending):
+    """Chaque scénario renvoie (méthode, chemin, corps JSON).
+
+    Les traitements par lot consomment pending[kind]: chaque appel porte sur une demande
+    encore en attente, jamais sur une demande déjà traitée (appel sans effet).
+    """
+    def phone():
+        return random.choice(phones)
+
+    def admin_action(kind):
+        return ('POST', f'/admin/{kind}/batch', {'action': 'reject', 'ids': [pending[kind].pop()]})
+
+    routes = {
+        'get_balance': lambda: ('GET', f'/get_balance/{phone()}', None),
+        'get_balance_page': lambda: ('GET', f'/get_balance/{phone()}?limit=50', None),
+        'get_balance_only': lambda: ('GET', f'/get_balance/{phone()}?fields=balance', None),
+        'add_income': lambda: ('POST', '/add_income', {'phone_number': phone(), 'amount': 1000, 'source': 'Bench'}),
+        'add_expense': lambda: ('POST', '/add_expense', {'phone_number': phone(), 'amount': 100, 'category': 'Bench'}),
+        'request_withdraw': lambda: ('POST', '/request_withdraw', {'phone_number': phone(), 'amount': 1}),
+        'admin_deposits': lambda: ('GET', '/admin/deposits', None),
+        'admin_withdraws': lambda: ('GET', '/admin/withdraws', None),
+        'admin_summary': lambda: ('GET', '/admin/summary', None),
+    }
+    for route, kind in ADMIN_BATCH_ROUTES.items():
+        routes[route] = lambda kind=kind: admin_action(kind)
+    return routes
+
+
+class TestClientDriver:
+    """Appels via le client de test Flask (un client par thread)."""
+
+    def __init__(self, server):
+        # Comme le maître gunicorn: migrations appliquées avant de servir
+        server.init_db()
+        server.close_db()
+        self.app = server.create_app()
+        self.local = threading.local()
+
+    def __call__(self, method, path, body):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+
+class HttpDriver:
+    """Appels HTTP vers un serveur local."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_route(driver, build, requests, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        method, path, body = build()
+        start = time.perf_counter()
+        status = driver(method, path, body)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status >= 500:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'req_per_s': round(requests / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def run(args):
+    phones_db = args.phones_from or args.db
+    if not phones_db or not os.path.exists(phones_db):
+        print('Base introuvable: --db (ou --phones-from en mode HTTP) est requis', file=sys.stderr)
+        return 1
+
+    conn = sqlite3.connect(phones_db)
+    phones = [row[0] for row in conn.execute('SELECT phone_number FROM users ORDER BY random() LIMIT ?', (args.sample,))]
+    conn.close()
+    if not phones:
+        print('Aucun utilisateur: lancez d\'abord "bench.py seed"', file=sys.stderr)
+        return 1
+
+    driver = HttpDriver(args.url) if args.url else TestClientDriver(load_server(args.db))
+    pending = {kind: [] for kind in ADMIN_BATCH_ROUTES.values()}
+    routes = scenarios(phones, pending)
+    selected = args.routes.split(',') if args.routes else list(routes)
+
+    results = {}
+    for name in selected:
+        if name not in routes:
+            print(f'Route inconnue: {name}', file=sys.stderr)
+            return 1
+        if name in ADMIN_BATCH_ROUTES:
+            # Une demande en attente neuve par requête, créée hors mesure
+            kind = ADMIN_BATCH_ROUTES[name]
+            pending[kind] = seed_pending_requests(phones_db, kind, args.requests)
+            if len(pending[kind]) < args.requests:
+                print(f'{name}: pas assez de solde disponible pour {args.requests} demandes', file=sys.stderr)
+                return 1
+        results[name] = run_route(driver, routes[name], args.requests, args.concurrency)
+        r = results[name]
+        print(f"{name:24} {r['req_per_s']:>9} req/s  p50 {r['p50_ms']:>8} ms  "
+              f"p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  erreurs {r['errors']}")
+
+    if args.output:
+        report = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'mode': 'http' if args.url else 'test_client',
+            'target': args.url or args.db,
+            'concurrency': args.concurrency,
+            'requests_per_route': args.requests,
+            'routes': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)['routes']
+    with open(args.after) as f:
+        after = json.load(f)['routes']
+
+    for name in sorted(set(before) & set(after)):
+        b, a = before[name], after[name]
+        ratio = a['req_per_s'] / b['req_per_s'] if b['req_per_s'] else float('inf')
+        print(f"{name:24} {b['req_per_s']:>9} -> {a['req_per_s']:>9} req/s (x{ratio:.2f})  "
+              f"p99 {b['p99_ms']:>8} -> {a['p99_ms']:>8} ms")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Banc de charge SaveUp BF')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('seed', help='Créer une base synthétique')
+    p.add_argument('--db', default='bench.db')
+    p.add_argument('--users', type=int, default=1000)
+    p.add_argument('--transactions', type=int, default=100000)
+    p.add_argument('--requests', type=int, default=1000, help='Demandes de dépôt et de retrait à créer')
+    p.add_argument('--days', type=int, default=365, help="Étendue de l'historique en jours")
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--append', action='store_true', help='Compléter une base existante')
+    p.set_defaults(func=seed)
+
+    p = commands.add_parser('run', help='Mesurer le débit et la latence par route')
+    p.add_argument('--db', default='bench.db', help='Base utilisée avec le client de test Flask')
+    p.add_argument('--url', help='Cibler un serveur HTTP au lieu du client de test')
+    p.add_argument('--phones-from', help='Base du serveur en mode HTTP: numéros lus, demandes à traiter créées (défaut: --db)')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--requests', type=int, default=500, help='Requêtes par route')
+    p.add_argument('--routes', help='Liste de routes séparées par des virgules (défaut: toutes)')
+    p.add_argument('--sample', type=int, default=1000, help='Nombre de numéros et de demandes tirés au hasard')
+    p.add_argument('--output', help='Fichier JSON de résultats')
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help='Comparer deux fichiers de résultats')
+    p.add_argument('before')
+    p.add_argument('after')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# Configuration de production: plusieurs processus, workers gevent par défaut.
+# Les requêtes empruntent leur connexion SQLite à un pool borné par processus
+# (SAVEUP_DB_POOL_SIZE, voir get_db dans server.py) et la rendent en fin de requête.
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# gevent pour servir de nombreux abonnés inactifs du canal /events (une greenlet par
+# connexion). Avec gthread, chaque flux SSE ouvert occupe un des GUNICORN_THREADS threads.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 5000))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+accesslog = '-'
+
+# Appliquer les migrations une seule fois avant de lancer les workers, dans un processus
+# à part: le maître n'importe pas server.py, que les workers gevent doivent importer
+# après le monkey-patching (threading.local de get_db, verrous, threads de fond).
+def on_starting(server):
+    subprocess.run(
+        [sys.executable, '-c', 'import server; server.init_db()'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True
+    )
@@ -1,17 +1,1097 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import bisect
+import click
+import csv
+import gzip
+import hashlib
+import html
+import io
+import json
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+import logging
+import os
+import queue
 import sqlite3
 import re
-from datetime import datetime
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
 
-app = Flask(__name__)
-CORS(app)  # Active CORS pour toutes les routes
+# Dépendances optionnelles: sérialisation JSON rapide et compression brotli
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-# Initialisation de la base de données
-def init_db():
-    conn = sqlite3.connect('saveup_bf.db')
-    c = conn.cursor()
+# Routes et commandes de l'application, enregistrées par create_app()
+bp = Blueprint('saveup', __name__, cli_group=None)
+
+# Configuration de la base de données
+DATABASE = os.environ.get('SAVEUP_DB', 'saveup_bf.db')
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('SAVEUP_DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KB = int(os.environ.get('SAVEUP_DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('SAVEUP_DB_MMAP_SIZE', 256 * 1024 * 1024))
+# Connexions ouvertes au plus par processus (voir ConnectionPool)
+DB_POOL_SIZE = int(os.environ.get('SAVEUP_DB_POOL_SIZE', 32))
+
+# Seuil de journalisation des requêtes SQL lentes
+SLOW_QUERY_MS = float(os.environ.get('SAVEUP_SLOW_QUERY_MS', 100))
+
+slow_query_logger = logging.getLogger('saveup.slow_query')
+
+# Connexion empruntée par le thread (ou la greenlet) en cours, rendue en fin de requête
+_local = threading.local()
+
+# Compteurs de la requête HTTP en cours (None hors requête)
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+# Imputer du temps SQL à la requête HTTP en cours et journaliser les requêtes lentes
+def _record_query(sql, params, elapsed, count=True):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.db_time += elapsed
+        if count:
+            stats.queries += 1
+    if count and elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning('Requête lente (%.1f ms): %s params=%r', elapsed * 1000, ' '.join(sql.split()), params)
+
+# Workers gevent: threading et time sont remplacés par leurs versions coopératives
+def _gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+# Exécuter une instruction sur une connexion ouverte sans attente SQLite (workers gevent):
+# une base verrouillée est réessayée après un time.sleep coopératif, jusqu'à
+# DB_BUSY_TIMEOUT_MS. L'attente en C de busy_timeout bloquerait toutes les greenlets.
+# Seul execute est réessayé: le verrou se rencontre sur BEGIN IMMEDIATE, et une fois
+# le verrou d'écriture pris les instructions suivantes n'attendent plus.
+def _execute_waiting(execute, sql, params):
+    deadline = time.monotonic() + DB_BUSY_TIMEOUT_MS / 1000
+    delay = 0.001
+    while True:
+        try:
+            return execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() >= deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+# Curseur chronométré: compte chaque requête et mesure le temps passé dans SQLite,
+# lecture des résultats comprise
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            if self.connection.cooperative_busy:
+                return _execute_waiting(super().execute, sql, params)
+            return super().execute(sql, params)
+        finally:
+            _record_query(sql, params, time.perf_counter() - start)
+    
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            _record_query(sql, '<executemany>', time.perf_counter() - start)
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record_query(None, None, time.perf_counter() - start, count=False)
+    
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            _record_query(None, None, time.perf_counter() - start, count=False)
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record_query(None, None, time.perf_counter() - start, count=False)
+
+# Enregistrer une action à exécuter après le prochain commit de la connexion du thread
+# (invalidation de cache, notifications). Un rollback les abandonne.
+def after_commit(callback):
+    if not hasattr(_local, 'after_commit'):
+        _local.after_commit = []
+    _local.after_commit.append(callback)
+
+class InstrumentedConnection(sqlite3.Connection):
+    cooperative_busy = False
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def commit(self):
+        super().commit()
+        callbacks = getattr(_local, 'after_commit', None)
+        if callbacks:
+            _local.after_commit = []
+            for callback in callbacks:
+                callback()
+    
+    def rollback(self):
+        super().rollback()
+        _local.after_commit = []
+    
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+    
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+# Ouvrir une connexion et appliquer les pragmas une seule fois. Via le pool, une connexion
+# peut passer d'un thread à l'autre, mais n'a jamais deux utilisateurs à la fois.
+def _connect(path):
+    cooperative = _gevent_patched()
+    busy_timeout_ms = 0 if cooperative else DB_BUSY_TIMEOUT_MS
+    conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000, cached_statements=256,
+                           factory=InstrumentedConnection, check_same_thread=False)
+    conn.cooperative_busy = cooperative
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {busy_timeout_ms}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+# Connexions d'un processus, prêtées pour la durée d'une requête (get_db) puis rendues
+# (release_db). Avec gevent, threading.local est propre à chaque greenlet: sans pool,
+# chaque requête ouvrirait sa connexion et réappliquerait les pragmas. Au plus `size`
+# connexions ouvertes: au-delà, l'emprunt attend qu'une connexion soit rendue.
+class ConnectionPool:
+    def __init__(self, path, size):
+        self.path = path
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+    
+    def acquire(self):
+        if not self.slots.acquire(timeout=DB_BUSY_TIMEOUT_MS / 1000):
+            raise sqlite3.OperationalError('Aucune connexion à la base disponible')
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return _connect(self.path)
+        except Exception:
+            self.slots.release()
+            raise
+    
+    # Rendre une connexion propre: toute transaction laissée ouverte est annulée
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            conn.close()
+        else:
+            self.idle.put(conn)
+        self.slots.release()
+    
+    # Connexion fermée par son emprunteur: libérer sa place
+    def discard(self, conn):
+        conn.close()
+        self.slots.release()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path, DB_POOL_SIZE))
+    return pool
+
+# Récupérer la connexion du thread courant (empruntée au pool au premier appel). Les
+# threads de fond (diffuseur, écrivain groupé, rapprochement) la gardent pour toujours.
+def get_db():
+    conns = getattr(_local, 'connections', None)
+    if conns is None:
+        conns = _local.connections = {}
+    conn = conns.get(DATABASE)
+    if conn is None:
+        conn = conns[DATABASE] = get_pool(DATABASE).acquire()
+    return conn
+
+# Rendre au pool les connexions du thread courant
+def release_connections():
+    conns = getattr(_local, 'connections', None)
+    _local.connections = {}
+    for path, conn in (conns or {}).items():
+        get_pool(path).release(conn)
+
+# Fermer les connexions du thread courant (arrêt du worker, tests)
+def close_db():
+    conns = getattr(_local, 'connections', None)
+    _local.connections = {}
+    for path, conn in (conns or {}).items():
+        get_pool(path).discard(conn)
+
+# En fin de requête, rendre la connexion au pool (transaction laissée ouverte annulée)
+@bp.teardown_app_request
+def release_db(exception):
+    release_connections()
+
+# Métriques du processus, exposées au format texte Prometheus sur /metrics.
+# Chaque worker gunicorn a ses propres compteurs.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+    
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.db_seconds = {}
+        self.serialize_seconds = {}
+        self.responses = {}
+    
+    def observe_request(self, route, method, status, stats):
+        key = (route, method)
+        with self.lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_seconds[key] = 0.0
+                self.serialize_seconds[key] = 0.0
+            self.latency[key].observe(time.perf_counter() - stats.started)
+            self.queries[key].observe(stats.queries)
+            self.db_seconds[key] += stats.db_time
+            self.serialize_seconds[key] += stats.serialize_time
+            status_key = (route, method, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+    
+    def render(self):
+        def labels(route, method):
+            return f'route="{route}",method="{method}"'
+        
+        lines = []
+        with self.lock:
+            lines.append('# HELP saveup_http_request_duration_seconds Durée des requêtes HTTP par route')
+            lines.append('# TYPE saveup_http_request_duration_seconds histogram')
+            for key, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.render('saveup_http_request_duration_seconds', labels(*key)))
+            
+            lines.append('# HELP saveup_db_queries_per_request Nombre de requêtes SQL par requête HTTP')
+            lines.append('# TYPE saveup_db_queries_per_request histogram')
+            for key, histogram in sorted(self.queries.items()):
+                lines.extend(histogram.render('saveup_db_queries_per_request', labels(*key)))
+            
+            lines.append('# HELP saveup_db_seconds_total Temps passé dans SQLite par route')
+            lines.append('# TYPE saveup_db_seconds_total counter')
+            for key, value in sorted(self.db_seconds.items()):
+                lines.append(f'saveup_db_seconds_total{{{labels(*key)}}} {value}')
+            
+            lines.append('# HELP saveup_serialization_seconds_total Temps passé à sérialiser les réponses JSON par route')
+            lines.append('# TYPE saveup_serialization_seconds_total counter')
+            for key, value in sorted(self.serialize_seconds.items()):
+                lines.append(f'saveup_serialization_seconds_total{{{labels(*key)}}} {value}')
+            
+            lines.append('# HELP saveup_http_responses_total Réponses HTTP par route et code')
+            lines.append('# TYPE saveup_http_responses_total counter')
+            for (route, method, status), value in sorted(self.responses.items()):
+                lines.append(f'saveup_http_responses_total{{{labels(route, method)},status="{status}"}} {value}')
+        
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# Sérialiseurs JSON enfichables: nom -> fonction (objet, default) -> bytes.
+# SAVEUP_JSON_BACKEND choisit le sérialiseur (par défaut orjson s'il est installé).
+# Les clés sont triées et les dates formatées comme le fait jsonify.
+JSON_BACKENDS = {}
+
+def register_json_backend(name, dumps):
+    JSON_BACKENDS[name] = dumps
+
+register_json_backend('json', lambda obj, default: json.dumps(
+    obj, default=default, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+).encode())
+
+if orjson is not None:
+    register_json_backend('orjson', lambda obj, default: orjson.dumps(
+        obj, default=default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    ))
+
+JSON_BACKEND = os.environ.get('SAVEUP_JSON_BACKEND', 'orjson' if orjson is not None else 'json')
+
+def encode_json(obj):
+    return JSON_BACKENDS[JSON_BACKEND](obj, DefaultJSONProvider.default)
+
+# Fragment JSON déjà encodé (par exemple par json_object() dans la requête SQL)
+class RawJSON(str):
+    pass
+
+# Fournisseur JSON de jsonify: sérialiseur choisi ci-dessus, temps de sérialisation mesuré
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return encode_json(obj).decode()
+    
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            body = encode_json(self._prepare_response_obj(args, kwargs))
+            return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+        finally:
+            stats = getattr(_local, 'stats', None)
+            if stats is not None:
+                stats.serialize_time += time.perf_counter() - start
+
+# Réponse {"data": {...}, "status": "success"} dont les champs RawJSON sont recopiés
+# tels quels: les lignes encodées par SQLite ne repassent pas par des dicts Python
+def success_response(data):
+    start = time.perf_counter()
+    try:
+        fields = []
+        for key, value in sorted(data.items()):
+            encoded = value.encode() if isinstance(value, RawJSON) else encode_json(value)
+            fields.append(encode_json(key) + b':' + encoded)
+        body = b'{"data":{' + b','.join(fields) + b'},"status":"success"}\n'
+        return current_app.response_class(body, mimetype='application/json')
+    finally:
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            stats.serialize_time += time.perf_counter() - start
+
+# Colonnes des listes encodées directement depuis le curseur: [(nom, expression SQL)]
+HISTORY_COLUMNS = [
+    ('id', 'id'),
+    ('type', 'type'),
+    ('amount', 'amount'),
+    ('category', 'category'),
+    ('note', 'note'),
+    ('date', 'date')
+]
+
+# Liste de sélection: identifiant, clé de tri, puis soit les colonnes (format en colonnes),
+# soit un objet JSON par ligne construit par SQLite (clés triées, comme le reste des réponses)
+def rows_select_sql(id_expr, sort_expr, columns, columnar):
+    if columnar:
+        payload = ', '.join(expr for _, expr in columns)
+    else:
+        payload = 'json_object(' + ', '.join(f"'{name}', {expr}" for name, expr in sorted(columns)) + ')'
+    return f'{id_expr}, {sort_expr}, {payload}'
+
+# Encoder des lignes lues avec rows_select_sql: tableau d'objets, ou en colonnes
+# {"columns": [...], "rows": [[...], ...]} (format=columns: les noms ne sont envoyés qu'une fois)
+def encode_rows(rows, columns, columnar):
+    if columnar:
+        return RawJSON(encode_json({
+            'columns': [name for name, _ in columns],
+            'rows': [row[2:] for row in rows]
+        }).decode())
+    return RawJSON('[' + ','.join(row[2] for row in rows) + ']')
+
+# Format des listes demandé par le client: objets (défaut) ou colonnes
+def wants_columnar(args):
+    return args.get('format') == 'columns'
+
+@bp.before_app_request
+def start_request_stats():
+    _local.stats = RequestStats()
+
+@bp.after_app_request
+def record_request_stats(response):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, stats)
+        _local.stats = None
+    return response
+
+# Compression des réponses (brotli si installé, sinon gzip) selon Accept-Encoding,
+# au-delà de SAVEUP_COMPRESS_MIN_SIZE octets. Les flux (exports, SSE) ne sont pas compressés.
+COMPRESS_MIN_SIZE = int(os.environ.get('SAVEUP_COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('SAVEUP_COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('SAVEUP_COMPRESS_BROTLI_QUALITY', 4))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+COMPRESSORS = {'gzip': lambda data: gzip.compress(data, COMPRESS_GZIP_LEVEL)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+
+# Meilleur encodage accepté par le client parmi ceux disponibles (brotli d'abord), ou None
+def negotiate_encoding(encodings):
+    return request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in encodings])
+
+@bp.after_app_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = negotiate_encoding(COMPRESSORS)
+    if encoding is None:
+        return response
+    
+    response.set_data(COMPRESSORS[encoding](data))
+    response.headers['Content-Encoding'] = encoding
+    # Même contenu, autre représentation: l'ETag devient faible
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Caches en mémoire (taille bornée, éviction LRU, expiration TTL).
+# L'interface get / set / delete / clear permet de brancher un autre backend
+# partagé entre workers via SAVEUP_CACHE_BACKEND et register_cache_backend().
+class LocalLRUCache:
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Backend sans cache (SAVEUP_CACHE_BACKEND=none)
+class NullCache:
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        self.misses += 1
+        return None
+    
+    def set(self, key, value):
+        pass
+    
+    def delete(self, key):
+        pass
+    
+    def clear(self):
+        pass
+
+CACHE_BACKENDS = {'local': LocalLRUCache, 'none': NullCache}
+CACHE_BACKEND = os.environ.get('SAVEUP_CACHE_BACKEND', 'local')
+CACHE_MAXSIZE = int(os.environ.get('SAVEUP_CACHE_MAXSIZE', 100000))
+USER_ID_CACHE_TTL = float(os.environ.get('SAVEUP_USER_ID_CACHE_TTL', 3600))
+
+caches = {}
+
+def register_cache_backend(name, factory):
+    CACHE_BACKENDS[name] = factory
+
+def make_cache(name, maxsize, ttl):
+    cache = CACHE_BACKENDS[CACHE_BACKEND](name, maxsize, ttl)
+    caches[name] = cache
+    return cache
+
+# numéro de téléphone -> user_id (seuls les utilisateurs existants sont mis en cache)
+user_id_cache = make_cache('user_id', CACHE_MAXSIZE, USER_ID_CACHE_TTL)
+
+# Les soldes ne sont pas mis en cache: une invalidation n'atteindrait que le processus
+# qui écrit, et les autres workers afficheraient un solde périmé. Leur lecture est une
+# recherche sur la clé primaire de balances (voir get_balance_version).
+
+def render_cache_metrics():
+    lines = [
+        '# HELP saveup_cache_hits_total Lectures servies par le cache',
+        '# TYPE saveup_cache_hits_total counter'
+    ]
+    for name, cache in sorted(caches.items()):
+        lines.append(f'saveup_cache_hits_total{{cache="{name}"}} {cache.hits}')
+    lines.append('# HELP saveup_cache_misses_total Lectures absentes du cache')
+    lines.append('# TYPE saveup_cache_misses_total counter')
+    for name, cache in sorted(caches.items()):
+        lines.append(f'saveup_cache_misses_total{{cache="{name}"}} {cache.misses}')
+    return '\n'.join(lines) + '\n'
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render() + render_cache_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Validation groupée (group commit): optionnelle, activée par SAVEUP_GROUP_COMMIT=1.
+# Un thread écrivain unique regroupe les écritures des requêtes concurrentes dans une
+# seule transaction, au plus GROUP_COMMIT_MAX_BATCH écritures ou GROUP_COMMIT_MAX_DELAY_MS
+# d'attente. Chaque requête n'est acquittée qu'après le commit de son lot.
+GROUP_COMMIT = os.environ.get('SAVEUP_GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get('SAVEUP_GROUP_COMMIT_MAX_BATCH', 256))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('SAVEUP_GROUP_COMMIT_MAX_DELAY_MS', 5))
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('SAVEUP_GROUP_COMMIT_TIMEOUT', 30))
+
+class GroupCommitWriter:
+    def __init__(self, max_batch, max_delay_ms):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self.thread.start()
+    
+    # Soumettre une écriture (fonction recevant un curseur) et attendre son commit
+    def submit(self, job):
+        future = Future()
+        self.queue.put((job, future))
+        return future.result(timeout=GROUP_COMMIT_TIMEOUT)
+    
+    def _run(self):
+        conn = get_db()
+        # Le coût du fsync est partagé par tout le lot: chaque commit est rendu durable
+        conn.execute("PRAGMA synchronous = FULL")
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+    
+    def _commit_batch(self, conn, batch):
+        results = []
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                # Un point de sauvegarde par écriture: un échec n'annule pas le reste du lot
+                c.execute("SAVEPOINT job")
+                try:
+                    results.append((future, job(c), None))
+                    c.execute("RELEASE job")
+                except Exception as e:
+                    c.execute("ROLLBACK TO job")
+                    c.execute("RELEASE job")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+_group_writer = None
+_group_writer_lock = threading.Lock()
+
+# Écrivain du processus, démarré à la première écriture (après le fork des workers)
+def get_group_writer():
+    global _group_writer
+    if _group_writer is None:
+        with _group_writer_lock:
+            if _group_writer is None:
+                _group_writer = GroupCommitWriter(GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_DELAY_MS)
+    return _group_writer
+
+# Exécuter une écriture et la valider: via l'écrivain groupé s'il est activé,
+# sinon directement sur la connexion du thread
+# La première écriture d'une requête portant une clé d'idempotence réserve cette clé.
+def run_write(job):
+    idempotency = g.pop('idempotency', None) if g else None
+    if idempotency:
+        job = reserve_idempotency_key(job, *idempotency)
+    
+    if GROUP_COMMIT:
+        return get_group_writer().submit(job)
+    
+    conn = get_db()
+    try:
+        c = conn.cursor()
+        # Verrou d'écriture pris d'emblée, comme dans l'écrivain groupé: les lectures
+        # faites par l'écriture (contrôle de solde...) restent valides jusqu'au commit
+        c.execute("BEGIN IMMEDIATE")
+        result = job(c)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+# Clés d'idempotence (en-tête Idempotency-Key) des écritures que les clients mobiles
+# rejouent. La clé est réservée dans la transaction même de l'écriture: deux essais
+# concurrents ne peuvent pas écrire tous les deux. La réponse est enregistrée ensuite
+# et renvoyée telle quelle aux essais suivants, jusqu'à expiration (SAVEUP_IDEMPOTENCY_TTL secondes).
+# Une réservation restée sans réponse au-delà de SAVEUP_IDEMPOTENCY_IN_FLIGHT_TIMEOUT secondes
+# (enregistrement échoué, processus arrêté) n'est plus « en cours »: l'écriture ayant été
+# validée avec la réservation, les essais suivants reçoivent un succès générique.
+IDEMPOTENCY_TTL = float(os.environ.get('SAVEUP_IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = float(os.environ.get('SAVEUP_IDEMPOTENCY_IN_FLIGHT_TIMEOUT', 30))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+class IdempotencyConflict(Exception):
+    pass
+
+# Envelopper une écriture pour qu'elle réserve d'abord la clé (une clé expirée est réutilisée)
+def reserve_idempotency_key(job, key, endpoint, fingerprint, token):
+    def reserving_job(c):
+        now = datetime.now()
+        c.execute(
+            "INSERT INTO idempotency_keys (key, endpoint, fingerprint, token, expires_at, reserved_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key, endpoint) DO UPDATE SET fingerprint = excluded.fingerprint, token = excluded.token, "
+            "status_code = NULL, response = NULL, expires_at = excluded.expires_at, reserved_at = excluded.reserved_at "
+            "WHERE idempotency_keys.expires_at <= ?",
+            (key, endpoint, fingerprint, token, now + timedelta(seconds=IDEMPOTENCY_TTL), now, now)
+        )
+        if c.rowcount == 0:
+            raise IdempotencyConflict(key)
+        return job(c)
+    return reserving_job
+
+# Réponse enregistrée pour une clé encore valide: (fingerprint, status_code, response, abandoned)
+# ou None. abandoned: réservée sans réponse depuis plus de IDEMPOTENCY_IN_FLIGHT_TIMEOUT.
+def lookup_idempotency_key(key, endpoint):
+    now = datetime.now()
+    c = get_db().cursor()
+    c.execute(
+        "SELECT fingerprint, status_code, response, "
+        "status_code IS NULL AND (reserved_at IS NULL OR reserved_at <= ?) "
+        "FROM idempotency_keys WHERE key = ? AND endpoint = ? AND expires_at > ?",
+        (now - timedelta(seconds=IDEMPOTENCY_IN_FLIGHT_TIMEOUT), key, endpoint, now)
+    )
+    return c.fetchone()
+
+def replay_response(status_code, response):
+    replay = Response(response, status=status_code, mimetype='application/json')
+    replay.headers['Idempotent-Replayed'] = 'true'
+    return replay
+
+# Décorateur des routes d'écriture: sans en-tête Idempotency-Key, rien ne change
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({
+                'status': 'error',
+                'message': f"L'en-tête Idempotency-Key doit faire de 1 à {IDEMPOTENCY_KEY_MAX_LENGTH} caractères"
+            }), 400
+        
+        endpoint = request.endpoint
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        stored = lookup_idempotency_key(key, endpoint)
+        if stored:
+            return idempotency_replay(stored, fingerprint)
+        
+        token = uuid.uuid4().hex
+        g.idempotency = (key, endpoint, fingerprint, token)
+        response = current_app.make_response(view(*args, **kwargs))
+        # Clé non consommée si la vue n'a rien écrit
+        g.pop('idempotency', None)
+        
+        # Enregistrer la réponse sur la ligne réservée par cette requête. L'écriture est
+        # déjà validée: un échec ici (base verrouillée...) ne change pas la réponse.
+        body = response.get_data(as_text=True)
+        try:
+            updated = run_write(lambda c: c.execute(
+                "UPDATE idempotency_keys SET status_code = ?, response = ? WHERE key = ? AND endpoint = ? AND token = ?",
+                (response.status_code, body, key, endpoint, token)
+            ).rowcount)
+        except Exception:
+            logging.getLogger('saveup.idempotency').exception("Échec de l'enregistrement de la réponse pour la clé %r", key)
+            return response
+        if not updated:
+            # Pas de réservation: erreur de validation, écriture annulée, ou clé
+            # réservée entre-temps par un autre essai (dont on renvoie alors la réponse)
+            stored = lookup_idempotency_key(key, endpoint)
+            if stored:
+                return idempotency_replay(stored, fingerprint)
+        return response
+    return wrapper
+
+def idempotency_replay(stored, fingerprint):
+    if stored is None or (stored[1] is None and not stored[3]):
+        return jsonify({
+            'status': 'error',
+            'message': 'Une requête avec cette clé d\'idempotence est en cours de traitement'
+        }), 409
+    if stored[0] != fingerprint:
+        return jsonify({
+            'status': 'error',
+            'message': 'Cette clé d\'idempotence a déjà été utilisée pour une autre requête'
+        }), 422
+    if stored[1] is None:
+        # Réservation abandonnée: l'écriture a eu lieu, mais sa réponse est perdue
+        replay = jsonify({
+            'status': 'success',
+            'message': 'Requête déjà traitée'
+        })
+        replay.headers['Idempotent-Replayed'] = 'true'
+        return replay
+    return replay_response(stored[1], stored[2])
+
+@bp.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Supprime les clés d'idempotence expirées."""
+    init_db()
+    purged = run_write(lambda c: c.execute(
+        "DELETE FROM idempotency_keys WHERE expires_at <= ?", (datetime.now(),)
+    ).rowcount)
+    click.echo(f'{purged} clé(s) expirée(s) supprimée(s).')
+
+# Canal de notifications (SSE ou long-poll). Les écritures ajoutent de petits événements
+# (transaction, balance, demande créée ou traitée) à la table events, dans leur propre
+# transaction: un événement n'existe que si l'écriture est validée, quel que soit le
+# worker. Dans chaque processus, un seul thread lit la table et répartit les nouveaux
+# événements entre les abonnés du canal concerné: un abonné n'est qu'une file, pas un
+# thread. gunicorn.conf.py lance des workers gevent: chaque connexion est une greenlet,
+# et des milliers de connexions inactives n'épuisent pas un pool de threads.
+# Les écritures purgent elles-mêmes les événements plus vieux que la rétention (au plus
+# une fois par EVENTS_PRUNE_INTERVAL secondes par processus), qu'il y ait des abonnés ou non.
+EVENTS_POLL_INTERVAL_MS = float(os.environ.get('SAVEUP_EVENTS_POLL_INTERVAL_MS', 200))
+EVENTS_RETENTION_SECONDS = int(os.environ.get('SAVEUP_EVENTS_RETENTION_SECONDS', 600))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('SAVEUP_EVENTS_HEARTBEAT_SECONDS', 15))
+EVENTS_POLL_MAX_TIMEOUT = 30
+EVENTS_PRUNE_INTERVAL = 60
+EVENTS_PRUNE_BATCH = 10000
+ADMIN_CHANNEL = 'admin'
+
+_events_pruned_at = 0.0
+
+# Supprimer les événements expirés, par identifiant: les plus anciens ont les plus petits,
+# et seuls les EVENTS_PRUNE_BATCH premiers sont examinés (created_at n'est pas indexé).
+def prune_events(c):
+    global _events_pruned_at
+    if time.monotonic() - _events_pruned_at < EVENTS_PRUNE_INTERVAL:
+        return
+    _events_pruned_at = time.monotonic()
+    c.execute('''
+        DELETE FROM events WHERE id < COALESCE(
+            (SELECT id FROM events
+             WHERE id < (SELECT MIN(id) FROM events) + ? AND created_at >= datetime('now', ?)
+             ORDER BY id LIMIT 1),
+            (SELECT MIN(id) FROM events) + ?
+        )
+    ''', (EVENTS_PRUNE_BATCH, f'-{EVENTS_RETENTION_SECONDS} seconds', EVENTS_PRUNE_BATCH))
+    if c.rowcount >= EVENTS_PRUNE_BATCH:
+        # Retard à rattraper: reprendre dès la prochaine écriture
+        _events_pruned_at = 0.0
+
+# Après l'ajout d'événements dans la transaction courante
+def events_published(c):
+    prune_events(c)
+    after_commit(wake_event_broker)
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+# Publier des événements [(canal, type, données)] dans la transaction courante
+def publish_events(c, events):
+    c.executemany(
+        "INSERT INTO events (channel, type, payload) VALUES (?, ?, ?)",
+        [(channel, type, json.dumps(payload, default=str)) for channel, type, payload in events]
+    )
+    events_published(c)
+
+# Publier les transactions d'identifiant > after_id (celles qui viennent d'être insérées),
+# avec la version du solde qui les inclut (voir /stats)
+def publish_transactions(c, after_id):
+    c.execute('''
+        INSERT INTO events (channel, type, payload)
+        SELECT 'user:' || user_id, 'transaction',
+               json_object('id', id, 'type', type, 'amount', amount, 'category', category, 'note', note, 'date', date,
+                           'version', (SELECT version FROM balances b WHERE b.user_id = transactions.user_id))
+        FROM transactions
+        WHERE id > ?
+        ORDER BY id
+    ''', (after_id,))
+    events_published(c)
+
+# Publier le solde et le solde disponible de plusieurs utilisateurs
+def publish_balances(c, user_ids):
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), SQL_IN_CHUNK_SIZE):
+        chunk = user_ids[i:i + SQL_IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f'''
+            INSERT INTO events (channel, type, payload)
+            SELECT 'user:' || user_id, 'balance', json_object('balance', balance, 'available_balance', balance - held)
+            FROM balances
+            WHERE user_id IN ({placeholders})
+        ''', chunk)
+    events_published(c)
+
+# Dernier identifiant de transaction (O(1) sur la clé primaire), pour publish_transactions
+def last_transaction_id(c):
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+    return c.fetchone()[0]
+
+class Subscriber:
+    def __init__(self, channels):
+        self.channels = channels
+        self.events = deque()
+        self.ready = threading.Event()
+    
+    def push(self, event):
+        self.events.append(event)
+        self.ready.set()
+    
+    # Attendre au plus timeout secondes et renvoyer les événements reçus
+    def wait(self, timeout):
+        self.ready.wait(timeout)
+        self.ready.clear()
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+class EventBroker:
+    def __init__(self, poll_interval_ms):
+        self.poll_interval = poll_interval_ms / 1000
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.last_id = get_db().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self.thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+        self.thread.start()
+    
+    def subscribe(self, channels):
+        subscriber = Subscriber(channels)
+        with self.lock:
+            for channel in channels:
+                self.subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            for channel in subscriber.channels:
+                channel_subscribers = self.subscribers.get(channel)
+                if channel_subscribers is not None:
+                    channel_subscribers.discard(subscriber)
+                    if not channel_subscribers:
+                        del self.subscribers[channel]
+    
+    def _run(self):
+        conn = get_db()
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                self._dispatch(conn)
+            except Exception:
+                logging.getLogger('saveup.events').exception('Échec de la diffusion des événements')
+    
+    def _dispatch(self, conn):
+        rows = conn.execute(
+            "SELECT id, channel, type, payload FROM events WHERE id > ? ORDER BY id LIMIT 1000", (self.last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        self.last_id = rows[-1][0]
+        with self.lock:
+            for row in rows:
+                for subscriber in self.subscribers.get(row[1], ()):
+                    subscriber.push(row)
+        if len(rows) == 1000:
+            self.wakeup.set()
+
+_event_broker = None
+_event_broker_lock = threading.Lock()
+
+# Diffuseur du processus, démarré au premier abonnement (après le fork des workers)
+def get_event_broker():
+    global _event_broker
+    if _event_broker is None:
+        with _event_broker_lock:
+            if _event_broker is None:
+                _event_broker = EventBroker(EVENTS_POLL_INTERVAL_MS)
+    return _event_broker
+
+# Après un commit local: diffuser sans attendre le prochain passage du thread
+def wake_event_broker():
+    if _event_broker is not None:
+        _event_broker.wakeup.set()
+
+# Événements manqués depuis after_id (reconnexion). Renvoie (événements, reset):
+# reset indique que des événements ont déjà été purgés et qu'il faut tout recharger.
+def fetch_missed_events(channel, after_id, until_id):
+    c = get_db().cursor()
+    c.execute("SELECT MIN(id) FROM events")
+    oldest = c.fetchone()[0]
+    reset = after_id < until_id and (oldest is None or oldest > after_id + 1)
+    c.execute(
+        "SELECT id, channel, type, payload FROM events WHERE channel = ? AND id > ? AND id <= ? ORDER BY id",
+        (channel, after_id, until_id)
+    )
+    return c.fetchall(), reset
+
+def format_sse(event):
+    return f'id: {event[0]}\nevent: {event[2]}\ndata: {event[3]}\n\n'
+
+# Abonner la requête à un canal: flux SSE, ou long-poll JSON avec poll=1
+# (after=<dernier id reçu>, timeout en secondes). Le flux SSE reprend après Last-Event-ID.
+def serve_events(channel):
+    after = request.args.get('after') or request.headers.get('Last-Event-ID')
+    try:
+        after_id = int(after) if after else None
+        timeout = min(float(request.args.get('timeout', EVENTS_POLL_MAX_TIMEOUT)), EVENTS_POLL_MAX_TIMEOUT)
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Paramètres after et timeout numériques requis'
+        }), 400
+    
+    broker = get_event_broker()
+    subscriber = broker.subscribe([channel])
+    # Les événements déjà diffusés sont relus en base, les suivants arrivent par l'abonné
+    until_id = broker.last_id
+    missed, reset = fetch_missed_events(channel, after_id, until_id) if after_id is not None else ([], False)
+    # La suite n'attend que l'abonné: connexion rendue au pool avant d'attendre ou de diffuser
+    release_connections()
+    
+    if request.args.get('poll') == '1':
+        try:
+            events = missed or [e for e in subscriber.wait(timeout) if e[0] > until_id]
+        finally:
+            broker.unsubscribe(subscriber)
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'events': [{'id': e[0], 'type': e[2], 'data': json.loads(e[3])} for e in events],
+                'last_id': events[-1][0] if events else (after_id if after_id is not None else until_id),
+                'reset': reset
+            }
+        }), 200
     
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            if reset:
+                yield 'event: reset\ndata: {}\n\n'
+            for event in missed:
+                yield format_sse(event)
+            while True:
+                events = [e for e in subscriber.wait(EVENTS_HEARTBEAT_SECONDS) if e[0] > until_id]
+                if not events:
+                    yield ': ping\n\n'
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Événements d'un utilisateur: transaction, balance
+@bp.route('/events/<phone_number>', methods=['GET'])
+def user_events(phone_number):
+    user_id = get_user_id(phone_number)
+    if not user_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'Aucun utilisateur trouvé avec ce numéro de téléphone'
+        }), 404
+    return serve_events(user_channel(user_id))
+
+# Événements d'administration: deposit_request, withdraw_request, request_processed
+@bp.route('/admin/events', methods=['GET'])
+def admin_events():
+    return serve_events(ADMIN_CHANNEL)
+
+# Solde recalculé à partir de l'historique (utilisé pour l'initialisation et la vérification)
+BALANCE_AGGREGATE_SQL = '''
+    SELECT
+        COALESCE(SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE 0 END), 0) -
+        COALESCE(SUM(CASE WHEN t.type = 'expense' THEN t.amount ELSE 0 END), 0)
+    FROM transactions t
+    WHERE t.user_id = u.id
+'''
+
+# Montant réservé par les retraits en attente d'un utilisateur (corrélé sur u.id)
+HELD_AGGREGATE_SQL = '''
+    SELECT COALESCE(SUM(wr.amount), 0)
+    FROM withdraw_requests wr
+    WHERE wr.user_id = u.id AND wr.status = 'pending'
+'''
+
+# Migrations du schéma, appliquées dans l'ordre et suivies par PRAGMA user_version.
+# Ne jamais modifier une migration déjà déployée: en ajouter une nouvelle.
+
+# 1. Schéma initial (IF NOT EXISTS: sans effet sur une base existante)
+def migration_initial_schema(c):
     # Table des utilisateurs
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -62,63 +1142,1040 @@ def init_db():
             processed_at TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
-    ''')
-    
-    # Table des demandes de dépôt Orange Money
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS deposit_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ''')
+    
+    # Table des demandes de dépôt Orange Money
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS deposit_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL,
+            amount REAL NOT NULL CHECK(amount > 0),
+            transaction_proof TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'approved', 'rejected')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP
+        )
+    ''')
+
+# 2. Table des soldes matérialisés
+def migration_balances(c):
+    # Table des soldes, maintenue à chaque écriture dans transactions
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS balances (
+            user_id INTEGER PRIMARY KEY,
+            balance REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Initialiser le solde des utilisateurs qui n'en ont pas encore
+    c.execute(f'''
+        INSERT INTO balances (user_id, balance)
+        SELECT u.id, ({BALANCE_AGGREGATE_SQL})
+        FROM users u
+        WHERE u.id NOT IN (SELECT user_id FROM balances)
+    ''')
+
+# 3. Index sur les colonnes de recherche fréquentes
+def migration_lookup_indexes(c):
+    # Historique d'un utilisateur trié par date
+    c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date DESC, id DESC)")
+    
+    # Dépôts en attente par numéro
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_deposits_phone ON pending_deposits (phone_number)")
+    
+    # Files d'administration filtrées par statut et triées par date
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_status_created ON deposit_requests (status, created_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_created ON deposit_requests (created_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_phone ON deposit_requests (phone_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_withdraw_requests_status_created ON withdraw_requests (status, created_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_withdraw_requests_created ON withdraw_requests (created_at DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_withdraw_requests_user ON withdraw_requests (user_id, status)")
+
+# Reconstruire une table avec un nouveau schéma (SQLite ne sait pas changer le type
+# d'une colonne): copie dans <table>_new, suppression, renommage
+def rebuild_table(c, table, create_sql, select_sql):
+    c.execute(create_sql.format(table=f'{table}_new'))
+    c.execute(f"INSERT INTO {table}_new {select_sql}")
+    c.execute(f"DROP TABLE {table}")
+    c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+# 4. Montants en entiers (FCFA, sans subdivision) au lieu de REAL
+def migration_integer_amounts(c):
+    # Refuser de changer un montant: les fractions de FCFA sont à corriger à la main avant
+    # de migrer (la migration est annulée, aucune ligne n'est arrondie)
+    for table in ('transactions', 'pending_deposits', 'withdraw_requests', 'deposit_requests'):
+        c.execute(f"SELECT id, amount FROM {table} WHERE amount != ROUND(amount) ORDER BY id LIMIT 10")
+        rows = c.fetchall()
+        if rows:
+            listed = ', '.join(f'id {row_id}: {amount}' for row_id, amount in rows)
+            raise RuntimeError(f'{table}: montants non entiers, conversion en FCFA impossible ({listed})')
+    
+    rebuild_table(c, 'transactions', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL CHECK(type IN ('income', 'expense')),
+            amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer' AND amount > 0),
+            category TEXT NOT NULL,
+            note TEXT,
+            date TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''', "SELECT id, user_id, type, CAST(ROUND(amount) AS INTEGER), category, note, date, created_at FROM transactions")
+    
+    rebuild_table(c, 'pending_deposits', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL,
+            amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer' AND amount > 0),
+            source TEXT NOT NULL,
+            note TEXT,
+            date TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''', "SELECT id, phone_number, CAST(ROUND(amount) AS INTEGER), source, note, date, created_at FROM pending_deposits")
+    
+    rebuild_table(c, 'withdraw_requests', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer' AND amount > 0),
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'approved', 'rejected')),
+            transaction_proof TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''', "SELECT id, user_id, CAST(ROUND(amount) AS INTEGER), status, transaction_proof, created_at, processed_at FROM withdraw_requests")
+    
+    rebuild_table(c, 'deposit_requests', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL,
+            amount INTEGER NOT NULL CHECK(typeof(amount) = 'integer' AND amount > 0),
+            transaction_proof TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'approved', 'rejected')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP
+        )
+    ''', "SELECT id, phone_number, CAST(ROUND(amount) AS INTEGER), transaction_proof, status, created_at, processed_at FROM deposit_requests")
+    
+    # Soldes recalculés exactement depuis les montants entiers
+    rebuild_table(c, 'balances', '''
+        CREATE TABLE {table} (
+            user_id INTEGER PRIMARY KEY,
+            balance INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''', f"SELECT u.id, ({BALANCE_AGGREGATE_SQL}), CURRENT_TIMESTAMP FROM users u")
+    
+    # Les index disparaissent avec les anciennes tables
+    migration_lookup_indexes(c)
+
+# 5. Agrégats par période et par catégorie, maintenus à chaque écriture dans transactions
+def migration_ledger_rollups(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_rollups (
+            user_id INTEGER NOT NULL,
+            period_kind TEXT NOT NULL CHECK(period_kind IN ('month', 'week')),
+            period TEXT NOT NULL,
+            type TEXT NOT NULL CHECK(type IN ('income', 'expense')),
+            category TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, period_kind, period, type, category)
+        ) WITHOUT ROWID
+    ''')
+    rebuild_rollups(c)
+
+# 6. Réservations: chaque demande de retrait en attente bloque son montant.
+# Solde disponible = balance - held
+def migration_withdraw_holds(c):
+    c.execute("ALTER TABLE balances ADD COLUMN held INTEGER NOT NULL DEFAULT 0")
+    c.execute(f"UPDATE balances SET held = ({HELD_AGGREGATE_SQL.replace('u.id', 'balances.user_id')})")
+
+# 7. Soldes reportés des mois archivés (voir archive_month)
+def migration_ledger_checkpoints(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            balance INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+# 8. Clés d'idempotence des écritures (voir idempotent)
+def migration_idempotency_keys(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            token TEXT NOT NULL,
+            status_code INTEGER,
+            response TEXT,
+            expires_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (key, endpoint)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)")
+
+# 9. Journal court des événements diffusés aux abonnés (voir EventBroker)
+def migration_events(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_channel ON events (channel, id)")
+
+# Tables dont chaque écriture incrémente la version (ETag des files et des dépôts en attente)
+VERSIONED_TABLES = ('users', 'pending_deposits', 'deposit_requests', 'withdraw_requests')
+
+# 10. Versions pour les GET conditionnels, tenues à jour par des déclencheurs: aucune
+# écriture ne peut les oublier. balances.version change avec le solde, la réservation
+# ou l'historique (archivage) de l'utilisateur.
+def migration_version_stamps(c):
+    c.execute("ALTER TABLE balances ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_balances_version AFTER UPDATE OF balance, held ON balances
+        BEGIN
+            UPDATE balances SET version = version + 1 WHERE user_id = NEW.user_id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_delete_version AFTER DELETE ON transactions
+        BEGIN
+            UPDATE balances SET version = version + 1 WHERE user_id = OLD.user_id;
+        END
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for table in VERSIONED_TABLES:
+        c.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{operation.lower()}_version AFTER {operation} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+# Tables portant un numéro de téléphone, normalisé dans la colonne phone_key
+PHONE_KEYED_TABLES = ('users', 'pending_deposits', 'deposit_requests')
+
+# 11. Numéros normalisés (voir phone_key): clé entière indexée pour toutes les recherches
+# et jointures, phone_number réécrit sous la forme canonique +226XXXXXXXX. Les comptes
+# créés sous les deux formes d'un même numéro sont fusionnés dans le plus ancien.
+def migration_phone_keys(c):
+    for table in PHONE_KEYED_TABLES:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN phone_key INTEGER")
+        c.execute(f"UPDATE {table} SET phone_key = {phone_key_sql('phone_number')}")
+    
+    merged = merge_duplicate_users(c)
+    if merged:
+        logging.getLogger('saveup.migrations').warning('%d compte(s) en double fusionné(s) par numéro', merged)
+    
+    for table in PHONE_KEYED_TABLES:
+        c.execute(f"UPDATE {table} SET phone_number = '+' || phone_key WHERE phone_key IS NOT NULL")
+    
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone_key ON users (phone_key)")
+    c.execute("DROP INDEX IF EXISTS idx_pending_deposits_phone")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_deposits_phone_key ON pending_deposits (phone_key)")
+    c.execute("DROP INDEX IF EXISTS idx_deposit_requests_phone")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deposit_requests_phone_key ON deposit_requests (phone_key)")
+
+# Fusionner les utilisateurs de même phone_key dans le plus ancien: transactions, retraits,
+# soldes, agrégats et soldes reportés, y compris les lignes déjà archivées.
+# Renvoie le nombre de comptes fusionnés.
+def merge_duplicate_users(c):
+    c.execute('''
+        CREATE TEMP TABLE user_merges AS
+        SELECT u.id AS old_id, k.keep_id AS new_id
+        FROM users u
+        JOIN (
+            SELECT phone_key, MIN(id) AS keep_id FROM users
+            WHERE phone_key IS NOT NULL
+            GROUP BY phone_key HAVING COUNT(*) > 1
+        ) k ON k.phone_key = u.phone_key
+        WHERE u.id <> k.keep_id
+    ''')
+    merged = c.execute("SELECT COUNT(*) FROM user_merges").fetchone()[0]
+    
+    if merged:
+        for table in ('transactions', 'withdraw_requests'):
+            c.execute(f'''
+                UPDATE {table} SET user_id = (SELECT new_id FROM user_merges WHERE old_id = {table}.user_id)
+                WHERE user_id IN (SELECT old_id FROM user_merges)
+            ''')
+        merge_archived_users(c.execute("SELECT old_id, new_id FROM user_merges").fetchall())
+        
+        c.execute('''
+            INSERT INTO balances (user_id, balance, held, updated_at)
+            SELECT m.new_id, SUM(b.balance), SUM(b.held), CURRENT_TIMESTAMP
+            FROM balances b JOIN user_merges m ON m.old_id = b.user_id
+            WHERE true GROUP BY m.new_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                balance = balance + excluded.balance,
+                held = held + excluded.held,
+                updated_at = excluded.updated_at
+        ''')
+        c.execute('''
+            INSERT INTO ledger_rollups (user_id, period_kind, period, type, category, total, count)
+            SELECT m.new_id, r.period_kind, r.period, r.type, r.category, SUM(r.total), SUM(r.count)
+            FROM ledger_rollups r JOIN user_merges m ON m.old_id = r.user_id
+            WHERE true GROUP BY m.new_id, r.period_kind, r.period, r.type, r.category
+            ON CONFLICT(user_id, period_kind, period, type, category) DO UPDATE SET
+                total = total + excluded.total,
+                count = count + excluded.count
+        ''')
+        c.execute('''
+            INSERT INTO ledger_checkpoints (user_id, balance, updated_at)
+            SELECT m.new_id, SUM(lc.balance), CURRENT_TIMESTAMP
+            FROM ledger_checkpoints lc JOIN user_merges m ON m.old_id = lc.user_id
+            WHERE true GROUP BY m.new_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                balance = balance + excluded.balance,
+                updated_at = excluded.updated_at
+        ''')
+        
+        for table in ('balances', 'ledger_rollups', 'ledger_checkpoints'):
+            c.execute(f"DELETE FROM {table} WHERE user_id IN (SELECT old_id FROM user_merges)")
+        c.execute("DELETE FROM users WHERE id IN (SELECT old_id FROM user_merges)")
+    
+    c.execute("DROP TABLE user_merges")
+    return merged
+
+# Reporter les fusions [(ancien id, id conservé)] dans chaque fichier d'archive, sinon
+# rebuild-rollups et les lectures avec archive=1 perdent les lignes des comptes supprimés.
+# Chaque fichier est validé à part, avant la base chaude: la mise à jour est rejouable,
+# et le compte conservé existe déjà si la migration échoue ensuite.
+def merge_archived_users(merges):
+    for _, path in list_archives():
+        archive = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        try:
+            archive.execute("BEGIN IMMEDIATE")
+            archive.execute("CREATE TEMP TABLE user_merges (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+            archive.executemany("INSERT INTO user_merges (old_id, new_id) VALUES (?, ?)", merges)
+            for table in ('transactions', 'withdraw_requests'):
+                archive.execute(f'''
+                    UPDATE {table} SET user_id = (SELECT new_id FROM user_merges WHERE old_id = {table}.user_id)
+                    WHERE user_id IN (SELECT old_id FROM user_merges)
+                ''')
+            archive.commit()
+        except Exception:
+            archive.rollback()
+            raise
+        finally:
+            archive.close()
+
+# 12. Semaines désignées par leur lundi (voir ROLLUP_PERIODS) au lieu de %Y-W%W, qui
+# coupait en deux la semaine du Nouvel An: agrégats recalculés
+def migration_week_periods(c):
+    rebuild_rollups(c)
+
+# 13. Date de réservation des clés d'idempotence (voir IDEMPOTENCY_IN_FLIGHT_TIMEOUT)
+def migration_idempotency_reserved_at(c):
+    c.execute("ALTER TABLE idempotency_keys ADD COLUMN reserved_at TIMESTAMP")
+
+MIGRATIONS = [
+    migration_initial_schema,
+    migration_balances,
+    migration_lookup_indexes,
+    migration_integer_amounts,
+    migration_ledger_rollups,
+    migration_withdraw_holds,
+    migration_ledger_checkpoints,
+    migration_idempotency_keys,
+    migration_events,
+    migration_version_stamps,
+    migration_phone_keys,
+    migration_week_periods,
+    migration_idempotency_reserved_at,
+]
+
+# Version courante du schéma
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Appliquer les migrations manquantes. Chaque migration s'exécute dans sa propre
+# transaction BEGIN IMMEDIATE; la version est relue sous le verrou pour que
+# plusieurs workers démarrant en même temps ne l'appliquent qu'une fois.
+def migrate_db(conn):
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if get_schema_version(conn) >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) < version:
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+# Initialisation de la base de données
+def init_db():
+    return migrate_db(get_db())
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Applique les migrations de schéma en attente."""
+    applied = init_db()
+    click.echo(f'Migration(s) appliquée(s): {applied or "aucune"}. Version du schéma: {get_schema_version(get_db())}.')
+
+# Enregistrer une transaction et mettre à jour le solde dans la même transaction SQL
+def record_transaction(c, user_id, type, amount, category, note, date):
+    c.execute(
+        "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, type, amount, category, note, date)
+    )
+    transaction_id = c.lastrowid
+    delta = amount if type == 'income' else -amount
+    c.execute(
+        "INSERT INTO balances (user_id, balance, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = CURRENT_TIMESTAMP",
+        (user_id, delta)
+    )
+    update_rollups(c, [(user_id, type, amount, category, date)])
+    publish_transactions(c, transaction_id - 1)
+    publish_balances(c, [user_id])
+    return transaction_id
+
+# Enregistrer un lot de transactions (user_id, type, amount, category, note, date)
+# avec executemany et une seule mise à jour de solde par utilisateur
+def record_transactions(c, rows):
+    if not rows:
+        return
+    first_id = last_transaction_id(c)
+    c.executemany(
+        "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    deltas = {}
+    for user_id, type, amount, _, _, _ in rows:
+        deltas[user_id] = deltas.get(user_id, 0) + (amount if type == 'income' else -amount)
+    c.executemany(
+        "INSERT INTO balances (user_id, balance, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = CURRENT_TIMESTAMP",
+        list(deltas.items())
+    )
+    update_rollups(c, [(user_id, type, amount, category, date) for user_id, type, amount, category, _, date in rows])
+    publish_transactions(c, first_id)
+    publish_balances(c, deltas)
+
+# Expression SQLite de la période d'agrégation d'une date. Une semaine est désignée par
+# son lundi (YYYY-MM-DD): la semaine à cheval sur le Nouvel An reste une seule période.
+ROLLUP_PERIODS = {
+    'month': "strftime('%Y-%m', {date})",
+    'week': "date({date}, '-6 days', 'weekday 1')"
+}
+
+# Ajouter des transactions (user_id, type, amount, category, date) aux agrégats
+def update_rollups(c, rows):
+    for period_kind, period_sql in ROLLUP_PERIODS.items():
+        c.executemany(
+            "INSERT INTO ledger_rollups (user_id, period_kind, period, type, category, total, count) "
+            f"VALUES (?, '{period_kind}', {period_sql.format(date='?')}, ?, ?, ?, 1) "
+            "ON CONFLICT(user_id, period_kind, period, type, category) "
+            "DO UPDATE SET total = total + excluded.total, count = count + 1",
+            [(user_id, date, type, category, amount) for user_id, type, amount, category, date in rows]
+        )
+
+# Recalculer tous les agrégats depuis transactions
+def rebuild_rollups(c):
+    c.execute("DELETE FROM ledger_rollups")
+    for period_kind, period_sql in ROLLUP_PERIODS.items():
+        period = period_sql.format(date='date')
+        c.execute(f'''
+            INSERT INTO ledger_rollups (user_id, period_kind, period, type, category, total, count)
+            SELECT user_id, '{period_kind}', {period}, type, category, SUM(amount), COUNT(*)
+            FROM transactions
+            GROUP BY user_id, {period}, type, category
+        ''')
+    
+    # Les mois archivés comptent aussi: agrégés dans chaque fichier puis cumulés
+    for _, path in list_archives():
+        archive = open_archive(path)
+        try:
+            for period_kind, period_sql in ROLLUP_PERIODS.items():
+                period = period_sql.format(date='date')
+                rows = archive.execute(f'''
+                    SELECT user_id, {period}, type, category, SUM(amount), COUNT(*)
+                    FROM transactions
+                    GROUP BY user_id, {period}, type, category
+                ''').fetchall()
+                c.executemany(
+                    "INSERT INTO ledger_rollups (user_id, period_kind, period, type, category, total, count) "
+                    f"VALUES (?, '{period_kind}', ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id, period_kind, period, type, category) "
+                    "DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+                    rows
+                )
+        finally:
+            archive.close()
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recalcule les agrégats de statistiques depuis transactions."""
+    init_db()
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    rebuild_rollups(conn.cursor())
+    conn.commit()
+    click.echo('Agrégats recalculés.')
+
+# Lire le solde courant d'un utilisateur (O(1))
+def get_user_balance(c, user_id):
+    c.execute("SELECT balance FROM balances WHERE user_id = ?", (user_id,))
+    result = c.fetchone()
+    return result[0] if result else 0
+
+# Solde disponible: solde moins les montants réservés par les retraits en attente
+def get_available_balance(c, user_id):
+    c.execute("SELECT balance - held FROM balances WHERE user_id = ?", (user_id,))
+    result = c.fetchone()
+    return result[0] if result else 0
+
+# Réserver un montant si le solde disponible le permet. Le contrôle et la réservation
+# tiennent en une seule instruction: renvoie False si le solde disponible est insuffisant.
+def hold_balance(c, user_id, amount):
+    c.execute(
+        "UPDATE balances SET held = held + ?, updated_at = CURRENT_TIMESTAMP "
+        "WHERE user_id = ? AND balance - held >= ?",
+        (amount, user_id, amount)
+    )
+    return c.rowcount == 1
+
+# Libérer des réservations [(user_id, amount)]
+def release_holds(c, holds):
+    c.executemany(
+        "UPDATE balances SET held = held - ?, updated_at = CURRENT_TIMESTAMP WHERE user_id = ?",
+        [(amount, user_id) for user_id, amount in holds]
+    )
+
+# Lire le solde et la version du grand livre (affichage et ETag), toujours dans la base:
+# une seule recherche sur la clé primaire, à jour quel que soit le worker qui a écrit
+def get_balance_version(c, user_id):
+    c.execute("SELECT balance, version FROM balances WHERE user_id = ?", (user_id,))
+    return c.fetchone() or (0, 0)
+
+# Étiquette de version de tables (voir VERSIONED_TABLES)
+def get_table_versions_tag(c, tables):
+    placeholders = ','.join('?' * len(tables))
+    c.execute(f"SELECT name, version FROM table_versions WHERE name IN ({placeholders}) ORDER BY name", tables)
+    return '-'.join(f'{name}.{version}' for name, version in c.fetchall())
+
+# GET conditionnel: réponse 304 si If-None-Match contient l'étiquette courante, sinon None
+def not_modified(tag):
+    if request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+        response.set_etag(tag)
+        return response
+    return None
+
+# Ajouter l'ETag à une réponse; no-cache: le client revalide à chaque fois
+def with_etag(response, tag):
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Recalculer les soldes depuis transactions (plus le solde reporté des mois archivés)
+# et signaler les écarts
+def rebuild_balances(fix=True):
+    conn = get_db()
+    c = conn.cursor()
+    
+    # Vérification et correction dans la même transaction: une écriture validée entre
+    # les deux ne peut pas être écrasée par un solde attendu déjà périmé
+    c.execute("BEGIN IMMEDIATE" if fix else "BEGIN")
+    try:
+        drifts = find_balance_drifts(c)
+        if fix and drifts:
+            c.executemany(
+                "INSERT INTO balances (user_id, balance, held, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) "
+                "ON CONFLICT(user_id) DO UPDATE SET balance = excluded.balance, held = excluded.held, updated_at = CURRENT_TIMESTAMP",
+                [(d['user_id'], d['expected'], d['expected_held']) for d in drifts]
+            )
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    return drifts
+
+# Soldes et réservations stockés qui diffèrent de ceux recalculés depuis transactions
+def find_balance_drifts(c):
+    c.execute(f'''
+        SELECT u.id, u.phone_number, COALESCE(b.balance, 0), ({BALANCE_AGGREGATE_SQL}) + COALESCE(lc.balance, 0),
+               COALESCE(b.held, 0), ({HELD_AGGREGATE_SQL})
+        FROM users u
+        LEFT JOIN balances b ON b.user_id = u.id
+        LEFT JOIN ledger_checkpoints lc ON lc.user_id = u.id
+    ''')
+    
+    drifts = []
+    for user_id, phone_number, stored, expected, stored_held, expected_held in c.fetchall():
+        if stored != expected or stored_held != expected_held:
+            drifts.append({
+                'user_id': user_id,
+                'phone_number': phone_number,
+                'stored': stored,
+                'expected': expected,
+                'stored_held': stored_held,
+                'expected_held': expected_held
+            })
+    return drifts
+
+@bp.cli.command('rebuild-balances')
+@click.option('--verify-only', is_flag=True, help='Signaler les écarts sans corriger les soldes')
+def rebuild_balances_command(verify_only):
+    """Recalcule les soldes et les réservations, et signale les écarts."""
+    init_db()
+    drifts = rebuild_balances(fix=not verify_only)
+    for d in drifts:
+        click.echo(
+            f"{d['phone_number']} (user {d['user_id']}): stocké={d['stored']} attendu={d['expected']} "
+            f"réservé={d['stored_held']} attendu={d['expected_held']}"
+        )
+    action = 'signalé(s)' if verify_only else 'corrigé(s)'
+    click.echo(f'{len(drifts)} écart(s) {action}.')
+
+# Archivage par niveaux: les mois clos de transactions et les demandes traitées sont
+# déplacés dans un fichier SQLite par mois (ARCHIVE_DIR/saveup_YYYY-MM.db), attaché
+# avec ATTACH. Le solde net de chaque utilisateur sur les mois archivés est reporté
+# dans ledger_checkpoints: balances et rebuild_balances restent exacts.
+# À lancer périodiquement (cron): flask archive
+ARCHIVE_DIR = os.environ.get('SAVEUP_ARCHIVE_DIR', os.path.join(os.path.dirname(DATABASE) or '.', 'archive'))
+ARCHIVE_KEEP_MONTHS = int(os.environ.get('SAVEUP_ARCHIVE_KEEP_MONTHS', 3))
+ARCHIVE_FILE_PATTERN = re.compile(r'^saveup_(\d{4}-\d{2})\.db$')
+
+# Tables archivées: {table: (colonne de partition, condition d'archivage, colonnes)}
+ARCHIVED_TABLES = {
+    'transactions': ('date', '1', 'id, user_id, type, amount, category, note, date, created_at'),
+    'deposit_requests': (
+        'created_at', "status != 'pending'",
+        'id, phone_number, amount, transaction_proof, status, created_at, processed_at'
+    ),
+    'withdraw_requests': (
+        'created_at', "status != 'pending'",
+        'id, user_id, amount, status, transaction_proof, created_at, processed_at'
+    )
+}
+
+# Schéma d'un fichier d'archive, attaché sous le nom 'archive'
+ARCHIVE_SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS archive.transactions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            note TEXT,
+            date TIMESTAMP NOT NULL,
+            created_at TIMESTAMP
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS archive.idx_transactions_user_date ON transactions (user_id, date DESC, id DESC)",
+    '''
+        CREATE TABLE IF NOT EXISTS archive.deposit_requests (
+            id INTEGER PRIMARY KEY,
             phone_number TEXT NOT NULL,
-            amount REAL NOT NULL CHECK(amount > 0),
+            amount INTEGER NOT NULL,
             transaction_proof TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'approved', 'rejected')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP,
             processed_at TIMESTAMP
         )
-    ''')
+    ''',
+    "CREATE INDEX IF NOT EXISTS archive.idx_deposit_requests_status_created ON deposit_requests (status, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_deposit_requests_created ON deposit_requests (created_at DESC, id DESC)",
+    '''
+        CREATE TABLE IF NOT EXISTS archive.withdraw_requests (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            transaction_proof TEXT,
+            created_at TIMESTAMP,
+            processed_at TIMESTAMP
+        )
+    ''',
+    "CREATE INDEX IF NOT EXISTS archive.idx_withdraw_requests_status_created ON withdraw_requests (status, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_withdraw_requests_created ON withdraw_requests (created_at DESC, id DESC)"
+]
+
+def archive_path(month):
+    return os.path.join(ARCHIVE_DIR, f'saveup_{month}.db')
+
+# Fichiers d'archive existants [(mois, chemin)], du plus récent au plus ancien
+def list_archives():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    archives = []
+    for name in os.listdir(ARCHIVE_DIR):
+        match = ARCHIVE_FILE_PATTERN.match(name)
+        if match:
+            archives.append((match.group(1), os.path.join(ARCHIVE_DIR, name)))
+    return sorted(archives, reverse=True)
+
+# Bornes [début, fin) d'un mois 'YYYY-MM', comparables aux dates stockées
+def month_bounds(month):
+    year, number = map(int, month.split('-'))
+    return f'{month}-01', f'{year + number // 12:04d}-{number % 12 + 1:02d}-01'
+
+# Premier jour du plus ancien mois gardé en base chaude
+def archive_cutoff(keep_months):
+    now = datetime.now()
+    index = now.year * 12 + now.month - 1 - keep_months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}-01'
+
+# Ouvrir un fichier d'archive en lecture seule
+def open_archive(path):
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+# Attacher un fichier d'archive sous le nom 'archive' (hors transaction)
+@contextmanager
+def attached_archive(conn, path):
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        yield
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+# Mois ayant des lignes archivables avant la date limite
+def archivable_months(c, cutoff):
+    months = set()
+    for table, (column, condition, _) in ARCHIVED_TABLES.items():
+        c.execute(f"SELECT DISTINCT substr({column}, 1, 7) FROM {table} WHERE {column} < ? AND {condition}", (cutoff,))
+        months.update(row[0] for row in c.fetchall())
+    return sorted(months)
+
+# Archiver un mois. Les validations ne sont atomiques que fichier par fichier: on copie
+# d'abord dans l'archive (INSERT OR IGNORE, rejouable), puis, dans une seconde transaction
+# qui n'écrit que dans la base chaude, on reporte les soldes et on supprime les lignes
+# copiées. Une interruption entre les deux laisse des doublons que le passage suivant résorbe.
+# Renvoie {table: lignes déplacées}
+def archive_month(conn, month):
+    start, end = month_bounds(month)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    moved = {}
+    with attached_archive(conn, archive_path(month)):
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            for sql in ARCHIVE_SCHEMA:
+                c.execute(sql)
+            for table, (column, condition, columns) in ARCHIVED_TABLES.items():
+                c.execute(
+                    f"INSERT OR IGNORE INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} "
+                    f"WHERE {column} >= ? AND {column} < ? AND {condition}",
+                    (start, end)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT INTO ledger_checkpoints (user_id, balance, updated_at) "
+                "SELECT user_id, SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END), CURRENT_TIMESTAMP "
+                "FROM main.transactions WHERE date >= ? AND date < ? AND id IN (SELECT id FROM archive.transactions) "
+                "GROUP BY user_id "
+                "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = CURRENT_TIMESTAMP",
+                (start, end)
+            )
+            for table, (column, condition, _) in ARCHIVED_TABLES.items():
+                c.execute(
+                    f"DELETE FROM main.{table} WHERE {column} >= ? AND {column} < ? AND {condition} "
+                    f"AND id IN (SELECT id FROM archive.{table})",
+                    (start, end)
+                )
+                moved[table] = c.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return moved
+
+@bp.cli.command('archive')
+@click.option('--keep-months', type=int, default=ARCHIVE_KEEP_MONTHS, show_default=True,
+              help='Mois clos gardés en base chaude, en plus du mois en cours')
+def archive_command(keep_months):
+    """Déplace les mois clos et les demandes traitées dans les archives mensuelles."""
+    init_db()
+    conn = get_db()
+    for month in archivable_months(conn.cursor(), archive_cutoff(keep_months)):
+        moved = archive_month(conn, month)
+        click.echo(f'{month}: ' + ', '.join(f'{table}={count}' for table, count in moved.items()))
+
+# Lire une page triée par (clé, id) décroissants dans la base chaude puis, si with_archives,
+# dans les archives. build_query(schema) renvoie (sql, args) pour 'main' ou 'archive';
+# sort_index est la position de la clé dans les lignes (id en position 0). Les archives
+# sont lues du mois le plus récent au plus ancien, et plus du tout dès que la page
+# (limit + 1 lignes) ne contient que des lignes postérieures au mois à lire.
+def fetch_with_archives(conn, build_query, sort_index, limit, before, with_archives):
+    sql, args = build_query('main')
+    rows = conn.execute(sql, args).fetchall()
+    if not with_archives:
+        return rows
     
-    conn.commit()
-    conn.close()
+    def sort_key(row):
+        return (row[sort_index], row[0])
+    
+    for month, path in list_archives():
+        start, end = month_bounds(month)
+        if before and before[0] < start:
+            continue
+        if limit and len(rows) > limit:
+            rows.sort(key=sort_key, reverse=True)
+            if rows[limit][sort_index] >= end:
+                break
+        with attached_archive(conn, path):
+            sql, args = build_query('archive')
+            rows.extend(conn.execute(sql, args).fetchall())
+    
+    # Une ligne peut figurer dans les deux bases si un archivage a été interrompu
+    unique = {}
+    for row in rows:
+        unique.setdefault(row[0], row)
+    rows = sorted(unique.values(), key=sort_key, reverse=True)
+    return rows[:limit + 1] if limit else rows
+
+# Convertir un montant reçu en entier de FCFA (le franc CFA n'a pas de subdivision).
+# Lève ValueError pour une valeur non numérique ou fractionnaire.
+def parse_amount(value):
+    if isinstance(value, bool):
+        raise ValueError('Montant invalide')
+    amount = float(value)
+    if not amount.is_integer():
+        raise ValueError('Le montant doit être un nombre entier de FCFA')
+    return int(amount)
+
+# Numéro burkinabé: +226XXXXXXXX ou 226XXXXXXXX
+PHONE_NUMBER_RE = re.compile(r'\+?(226[0-9]{8})')
+
+INVALID_PHONE_NUMBER_MESSAGE = 'Format de numéro de téléphone invalide. Utilisez le format: +226XXXXXXXX ou 226XXXXXXXX'
+
+# Normalisation canonique d'un numéro, appliquée à chaque point d'entrée: clé entière
+# 226XXXXXXXX (colonne phone_key indexée), ou None si le format est invalide
+def phone_key(phone_number):
+    if not isinstance(phone_number, str):
+        return None
+    match = PHONE_NUMBER_RE.fullmatch(phone_number.strip())
+    return int(match.group(1)) if match else None
+
+# Forme canonique stockée dans phone_number et renvoyée par l'API
+def format_phone_number(key):
+    return f'+{key}'
 
-# Vérification du format du numéro de téléphone
-def is_valid_phone_number(phone_number):
-    pattern = r'^\+?226\d{8}$'  # Format Burkinabé: +226XXXXXXXX ou 226XXXXXXXX
-    return re.match(pattern, phone_number) is not None
+# Même normalisation en SQL pour les numéros déjà stockés (NULL si le format est invalide)
+def phone_key_sql(column):
+    digits = '[0-9]' * 8
+    return (f"CASE WHEN TRIM({column}) GLOB '226{digits}' OR TRIM({column}) GLOB '+226{digits}' "
+            f"THEN CAST(LTRIM(TRIM({column}), '+') AS INTEGER) END")
 
 # Récupérer l'ID utilisateur à partir du numéro de téléphone
 def get_user_id(phone_number):
-    conn = sqlite3.connect('saveup_bf.db')
+    key = phone_key(phone_number)
+    if key is None:
+        return None
+    
+    user_id = user_id_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE phone_number = ?", (phone_number,))
+    c.execute("SELECT id FROM users WHERE phone_key = ?", (key,))
     result = c.fetchone()
-    conn.close()
+    if result:
+        user_id_cache.set(key, result[0])
     return result[0] if result else None
 
-# Appliquer les dépôts en attente pour un utilisateur
-def apply_pending_deposits(user_id, phone_number):
-    conn = sqlite3.connect('saveup_bf.db')
-    c = conn.cursor()
-    
-    # Récupérer les dépôts en attente
-    c.execute("SELECT * FROM pending_deposits WHERE phone_number = ?", (phone_number,))
-    pending_deposits = c.fetchall()
+# Nombre maximal de paramètres par requête IN
+SQL_IN_CHUNK_SIZE = 500
+
+# Résoudre plusieurs clés de numéro en une requête IN par tranche: {phone_key: user_id}
+def get_user_ids(phone_keys):
+    c = get_db().cursor()
+    phone_keys = list({key for key in phone_keys if key is not None})
+    user_ids = {}
+    for i in range(0, len(phone_keys), SQL_IN_CHUNK_SIZE):
+        chunk = phone_keys[i:i + SQL_IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f"SELECT phone_key, id FROM users WHERE phone_key IN ({placeholders})", chunk)
+        user_ids.update(c.fetchall())
+    return user_ids
+
+# Créditer, dans la transaction courante, les dépôts en attente dont le numéro correspond
+# à un utilisateur existant: tout est fait en SQL (INSERT ... SELECT puis DELETE).
+# `condition` filtre sur les alias pd (pending_deposits) et u (users).
+# Renvoie le nombre de dépôts crédités.
+def credit_pending_deposits(c, condition, args):
+    source = f"FROM pending_deposits pd JOIN users u ON u.phone_key = pd.phone_key WHERE {condition}"
+    c.execute(f"SELECT DISTINCT u.id {source}", args)
+    user_ids = [row[0] for row in c.fetchall()]
+    if not user_ids:
+        return 0
     
-    if pending_deposits:
-        # Ajouter chaque dépôt en attente comme revenu
-        for deposit in pending_deposits:
+    c.execute(
+        "INSERT INTO balances (user_id, balance, updated_at) "
+        f"SELECT u.id, SUM(pd.amount), CURRENT_TIMESTAMP {source} GROUP BY u.id "
+        "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = CURRENT_TIMESTAMP",
+        args
+    )
+    for period_kind, period_sql in ROLLUP_PERIODS.items():
+        period = period_sql.format(date='pd.date')
+        c.execute(
+            "INSERT INTO ledger_rollups (user_id, period_kind, period, type, category, total, count) "
+            f"SELECT u.id, '{period_kind}', {period}, 'income', pd.source, SUM(pd.amount), COUNT(*) "
+            f"{source} GROUP BY u.id, {period}, pd.source "
+            "ON CONFLICT(user_id, period_kind, period, type, category) "
+            "DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+            args
+        )
+    first_id = last_transaction_id(c)
+    c.execute(
+        "INSERT INTO transactions (user_id, type, amount, category, note, date) "
+        f"SELECT u.id, 'income', pd.amount, pd.source, pd.note, pd.date {source} ORDER BY pd.id",
+        args
+    )
+    credited = c.rowcount
+    c.execute(f"DELETE FROM pending_deposits WHERE id IN (SELECT pd.id {source})", args)
+    publish_transactions(c, first_id)
+    publish_balances(c, user_ids)
+    return credited
+
+# Créditer les dépôts en attente d'un utilisateur, sur la connexion de l'appelant
+def apply_pending_deposits(c, key):
+    return credit_pending_deposits(c, "pd.phone_key = ?", (key,))
+
+# Réconciliation des dépôts en attente: un dépôt peut rester en attente alors que
+# l'utilisateur existe (course avec la création du compte, import en masse...).
+# Le réconciliateur parcourt le stock par tranches d'identifiants, une transaction
+# courte par tranche. Thread de fond optionnel: SAVEUP_RECONCILE_INTERVAL secondes (0 = désactivé).
+RECONCILE_CHUNK_SIZE = int(os.environ.get('SAVEUP_RECONCILE_CHUNK_SIZE', 1000))
+RECONCILE_INTERVAL = float(os.environ.get('SAVEUP_RECONCILE_INTERVAL', 0))
+
+reconcile_logger = logging.getLogger('saveup.reconcile')
+
+def reconcile_pending_deposits(conn, chunk_size=RECONCILE_CHUNK_SIZE, max_chunks=None):
+    credited = 0
+    last_id = 0
+    chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
             c.execute(
-                "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, 'income', ?, ?, ?, ?)",
-                (user_id, deposit[2], deposit[3], deposit[4], deposit[5])
+                "SELECT MAX(id) FROM (SELECT pd.id FROM pending_deposits pd "
+                "JOIN users u ON u.phone_key = pd.phone_key "
+                "WHERE pd.id > ? ORDER BY pd.id LIMIT ?)",
+                (last_id, chunk_size)
             )
-        
-        # Supprimer les dépôts en attente après les avoir appliqués
-        c.execute("DELETE FROM pending_deposits WHERE phone_number = ?", (phone_number,))
-        conn.commit()
-    
-    conn.close()
-    return len(pending_deposits)
+            upper = c.fetchone()[0]
+            if upper is None:
+                conn.rollback()
+                break
+            credited += credit_pending_deposits(c, "pd.id > ? AND pd.id <= ?", (last_id, upper))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        last_id = upper
+        chunks += 1
+    return credited
+
+# Tranches d'âge (en jours) des dépôts en attente: (clé, borne supérieure exclue)
+PENDING_AGE_BUCKETS = [
+    ('lt_1d', 1),
+    ('1d_7d', 7),
+    ('7d_30d', 30),
+    ('gt_30d', None)
+]
+
+# Dépôts encore en attente, groupés par âge. `matched` compte ceux dont l'utilisateur
+# existe déjà (ils seront crédités au prochain passage du réconciliateur).
+def pending_deposit_ages(c):
+    cases = ' '.join(f"WHEN age < {limit} THEN '{key}'" for key, limit in PENDING_AGE_BUCKETS if limit is not None)
+    c.execute(f'''
+        SELECT CASE {cases} ELSE '{PENDING_AGE_BUCKETS[-1][0]}' END AS bucket,
+               COUNT(*), SUM(amount), SUM(matched)
+        FROM (
+            SELECT pd.amount, julianday('now') - julianday(pd.created_at) AS age,
+                   EXISTS(SELECT 1 FROM users u WHERE u.phone_key = pd.phone_key) AS matched
+            FROM pending_deposits pd
+        )
+        GROUP BY bucket
+    ''')
+    ages = {key: {'count': 0, 'amount': 0, 'matched': 0} for key, _ in PENDING_AGE_BUCKETS}
+    for bucket, count, amount, matched in c.fetchall():
+        ages[bucket] = {'count': count, 'amount': amount, 'matched': matched}
+    return ages
+
+_reconciler_thread = None
+_reconciler_lock = threading.Lock()
+
+def _run_reconciler(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            credited = reconcile_pending_deposits(get_db())
+            if credited:
+                reconcile_logger.info('%d dépôt(s) en attente crédité(s)', credited)
+        except Exception:
+            reconcile_logger.exception('Échec de la réconciliation des dépôts en attente')
+
+# Démarrer le réconciliateur du processus (une fois par worker)
+def start_reconciler(interval=RECONCILE_INTERVAL):
+    global _reconciler_thread
+    if interval <= 0:
+        return
+    with _reconciler_lock:
+        if _reconciler_thread is None:
+            _reconciler_thread = threading.Thread(
+                target=_run_reconciler, args=(interval,), name='pending-deposit-reconciler', daemon=True
+            )
+            _reconciler_thread.start()
+
+@bp.cli.command('reconcile-pending')
+@click.option('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, show_default=True)
+@click.option('--report-only', is_flag=True, help='Afficher le stock en attente sans créditer')
+def reconcile_pending_command(chunk_size, report_only):
+    """Crédite les dépôts en attente des utilisateurs existants et affiche le stock restant."""
+    init_db()
+    conn = get_db()
+    if not report_only:
+        credited = reconcile_pending_deposits(conn, chunk_size)
+        click.echo(f'{credited} dépôt(s) en attente crédité(s).')
+    for key, row in pending_deposit_ages(conn.cursor()).items():
+        click.echo(f"{key}: {row['count']} dépôt(s), {row['amount'] or 0} FCFA, {row['matched']} avec utilisateur")
 
-@app.route('/create_user', methods=['POST'])
+@bp.route('/create_user', methods=['POST'])
 def create_user():
     data = request.get_json()
     
@@ -132,18 +2189,20 @@ def create_user():
             'message': 'Le numéro de téléphone et le nom sont requis'
         }), 400
     
-    if not is_valid_phone_number(phone_number):
+    key = phone_key(phone_number)
+    if key is None:
         return jsonify({
             'status': 'error',
-            'message': 'Format de numéro de téléphone invalide. Utilisez le format: +226XXXXXXXX ou 226XXXXXXXX'
+            'message': INVALID_PHONE_NUMBER_MESSAGE
         }), 400
+    phone_number = format_phone_number(key)
     
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
         # Vérifier si l'utilisateur existe déjà
-        c.execute("SELECT id FROM users WHERE phone_number = ?", (phone_number,))
+        c.execute("SELECT id FROM users WHERE phone_key = ?", (key,))
         if c.fetchone():
             return jsonify({
                 'status': 'error',
@@ -152,16 +2211,16 @@ def create_user():
         
         # Créer l'utilisateur
         c.execute(
-            "INSERT INTO users (phone_number, name) VALUES (?, ?)",
-            (phone_number, name)
+            "INSERT INTO users (phone_number, phone_key, name) VALUES (?, ?, ?)",
+            (phone_number, key, name)
         )
         user_id = c.lastrowid
+        c.execute("INSERT INTO balances (user_id, balance) VALUES (?, 0)", (user_id,))
         
         # Appliquer les dépôts en attente s'il y en a
-        pending_count = apply_pending_deposits(user_id, phone_number)
+        pending_count = apply_pending_deposits(c, key)
         
         conn.commit()
-        conn.close()
         
         return jsonify({
             'status': 'success',
@@ -179,7 +2238,8 @@ def create_user():
             'message': f'Erreur lors de la création de l\'utilisateur: {str(e)}'
         }), 500
 
-@app.route('/add_income', methods=['POST'])
+@bp.route('/add_income', methods=['POST'])
+@idempotent
 def add_income():
     data = request.get_json()
     
@@ -196,8 +2256,15 @@ def add_income():
             'message': 'Le numéro de téléphone, le montant et la source sont requis'
         }), 400
     
+    key = phone_key(phone_number)
+    if key is None:
+        return jsonify({
+            'status': 'error',
+            'message': INVALID_PHONE_NUMBER_MESSAGE
+        }), 400
+    
     try:
-        amount = float(amount)
+        amount = parse_amount(amount)
         if amount <= 0:
             return jsonify({
                 'status': 'error',
@@ -226,16 +2293,7 @@ def add_income():
         
         if user_id:
             # L'utilisateur existe, ajouter la transaction
-            conn = sqlite3.connect('saveup_bf.db')
-            c = conn.cursor()
-            
-            c.execute(
-                "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, 'income', ?, ?, ?, ?)",
-                (user_id, amount, source, note, date)
-            )
-            
-            conn.commit()
-            conn.close()
+            run_write(lambda c: record_transaction(c, user_id, 'income', amount, source, note, date))
             
             return jsonify({
                 'status': 'success',
@@ -243,16 +2301,10 @@ def add_income():
             }), 201
         else:
             # L'utilisateur n'existe pas, stocker le dépôt en attente
-            conn = sqlite3.connect('saveup_bf.db')
-            c = conn.cursor()
-            
-            c.execute(
-                "INSERT INTO pending_deposits (phone_number, amount, source, note, date) VALUES (?, ?, ?, ?, ?)",
-                (phone_number, amount, source, note, date)
-            )
-            
-            conn.commit()
-            conn.close()
+            run_write(lambda c: c.execute(
+                "INSERT INTO pending_deposits (phone_number, phone_key, amount, source, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                (format_phone_number(key), key, amount, source, note, date)
+            ))
             
             return jsonify({
                 'status': 'success',
@@ -265,7 +2317,8 @@ def add_income():
             'message': f'Erreur lors de l\'ajout du revenu: {str(e)}'
         }), 500
 
-@app.route('/add_expense', methods=['POST'])
+@bp.route('/add_expense', methods=['POST'])
+@idempotent
 def add_expense():
     data = request.get_json()
     
@@ -283,7 +2336,7 @@ def add_expense():
         }), 400
     
     try:
-        amount = float(amount)
+        amount = parse_amount(amount)
         if amount <= 0:
             return jsonify({
                 'status': 'error',
@@ -316,30 +2369,321 @@ def add_expense():
         date = datetime.now()
     
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        run_write(lambda c: record_transaction(c, user_id, 'expense', amount, category, note, date))
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Dépense ajoutée avec succès'
+        }), 201
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Erreur lors de l\'ajout de la dépense: {str(e)}'
+        }), 500
+
+# Nombre maximal de lignes par import groupé
+BULK_MAX_ROWS = 10000
+
+# Valider une ligne d'import groupé; renvoie (ligne normalisée, erreur)
+def validate_bulk_row(row):
+    if not isinstance(row, dict):
+        return None, 'Ligne invalide'
+    
+    phone_number = row.get('phone_number')
+    type = row.get('type')
+    amount = row.get('amount')
+    note = row.get('note', '')
+    date_str = row.get('date')
+    
+    if type not in ('income', 'expense'):
+        return None, "Le type doit être 'income' ou 'expense'"
+    
+    # 'source' pour les revenus, 'category' pour les dépenses, comme add_income / add_expense
+    if type == 'income':
+        category = row.get('source') or row.get('category')
+    else:
+        category = row.get('category')
+    
+    if not phone_number or not amount or not category:
+        return None, 'Le numéro de téléphone, le montant et la catégorie sont requis'
+    
+    key = phone_key(phone_number)
+    if key is None:
+        return None, INVALID_PHONE_NUMBER_MESSAGE
+    
+    try:
+        amount = parse_amount(amount)
+    except (TypeError, ValueError):
+        return None, 'Le montant doit être un nombre valide'
+    if amount <= 0:
+        return None, 'Le montant doit être positif'
+    
+    if date_str:
+        try:
+            date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None, 'Format de date invalide. Utilisez le format ISO (YYYY-MM-DD)'
+    else:
+        date = datetime.now()
+    
+    return (key, type, amount, category, note, date), None
+
+# Import groupé de revenus et de dépenses
+@bp.route('/transactions/bulk', methods=['POST'])
+def bulk_transactions():
+    data = request.get_json()
+    
+    rows = data.get('transactions') if isinstance(data, dict) else None
+    if not isinstance(rows, list) or not rows:
+        return jsonify({
+            'status': 'error',
+            'message': 'Une liste de transactions est requise'
+        }), 400
+    
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Au plus {BULK_MAX_ROWS} transactions par requête'
+        }), 400
+    
+    # Validation de toutes les lignes avant toute écriture
+    results = []
+    valid = []
+    for index, row in enumerate(rows):
+        parsed, error = validate_bulk_row(row)
+        if error:
+            results.append({'index': index, 'status': 'error', 'message': error})
+        else:
+            results.append(None)
+            valid.append((index, parsed))
+    
+    try:
+        conn = get_db()
         c = conn.cursor()
         
-        c.execute(
-            "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, 'expense', ?, ?, ?, ?)",
-            (user_id, amount, category, note, date)
-        )
+        # Une seule transaction pour tout le lot
+        c.execute("BEGIN IMMEDIATE")
+        
+        user_ids = get_user_ids(parsed[0] for _, parsed in valid)
+        
+        transactions = []
+        pending = []
+        for index, (key, type, amount, category, note, date) in valid:
+            user_id = user_ids.get(key)
+            if user_id:
+                transactions.append((user_id, type, amount, category, note, date))
+                results[index] = {'index': index, 'status': 'success'}
+            elif type == 'income':
+                # Utilisateur inconnu: dépôt en attente, comme add_income
+                pending.append((format_phone_number(key), key, amount, category, note, date))
+                results[index] = {'index': index, 'status': 'pending'}
+            else:
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'message': 'Aucun utilisateur trouvé avec ce numéro de téléphone'
+                }
+        
+        record_transactions(c, transactions)
+        if pending:
+            c.executemany(
+                "INSERT INTO pending_deposits (phone_number, phone_key, amount, source, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                pending
+            )
         
         conn.commit()
-        conn.close()
         
         return jsonify({
             'status': 'success',
-            'message': 'Dépense ajoutée avec succès'
+            'message': f'{len(transactions)} transaction(s) enregistrée(s), {len(pending)} dépôt(s) en attente',
+            'data': {
+                'inserted': len(transactions),
+                'pending': len(pending),
+                'errors': len(rows) - len(transactions) - len(pending),
+                'results': results
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Erreur lors de l'import groupé: {str(e)}"
+        }), 500
+
+# Transfert atomique entre deux utilisateurs
+@bp.route('/transfer', methods=['POST'])
+@idempotent
+def transfer():
+    data = request.get_json()
+    
+    sender_phone = data.get('sender_phone')
+    recipient_phone = data.get('recipient_phone')
+    amount = data.get('amount')
+    note = data.get('note', '')
+    
+    # Validation des données
+    if not sender_phone or not recipient_phone or not amount:
+        return jsonify({
+            'status': 'error',
+            'message': "Le numéro de l'expéditeur, celui du destinataire et le montant sont requis"
+        }), 400
+    
+    sender_key = phone_key(sender_phone)
+    recipient_key = phone_key(recipient_phone)
+    if sender_key is not None and sender_key == recipient_key:
+        return jsonify({
+            'status': 'error',
+            'message': 'Vous ne pouvez pas transférer à vous-même'
+        }), 400
+    
+    try:
+        amount = parse_amount(amount)
+        if amount <= 0:
+            return jsonify({
+                'status': 'error',
+                'message': 'Le montant doit être positif'
+            }), 400
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Le montant doit être un nombre valide'
+        }), 400
+    
+    sender_id = get_user_id(sender_phone)
+    if not sender_id:
+        return jsonify({
+            'status': 'error',
+            'message': "Aucun utilisateur trouvé avec le numéro de l'expéditeur"
+        }), 404
+    
+    recipient_id = get_user_id(recipient_phone)
+    if not recipient_id:
+        return jsonify({
+            'status': 'error',
+            'message': "Le destinataire n'existe pas"
+        }), 404
+    
+    # Le contrôle du solde et les deux écritures forment une seule opération atomique,
+    # sous le verrou d'écriture. Renvoie None si le solde disponible est insuffisant.
+    def transfer_funds(c):
+        if get_available_balance(c, sender_id) < amount:
+            return None
+        
+        date = datetime.now()
+        suffix = f': {note}' if note else ''
+        record_transaction(c, sender_id, 'expense', amount, 'Transfert', f'Transfert à {format_phone_number(recipient_key)}{suffix}', date)
+        record_transaction(c, recipient_id, 'income', amount, 'Transfert', f'Transfert de {format_phone_number(sender_key)}{suffix}', date)
+        return get_user_balance(c, sender_id), get_user_balance(c, recipient_id)
+    
+    try:
+        balances = run_write(transfer_funds)
+        if balances is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Solde insuffisant pour effectuer ce transfert'
+            }), 400
+        sender_balance, recipient_balance = balances
+        
+        return jsonify({
+            'status': 'success',
+            'message': 'Transfert effectué avec succès',
+            'data': {
+                'sender_balance': sender_balance,
+                'recipient_balance': recipient_balance
+            }
         }), 201
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors de l\'ajout de la dépense: {str(e)}'
+            'message': f'Erreur lors du transfert: {str(e)}'
         }), 500
 
-@app.route('/get_balance/<phone_number>', methods=['GET'])
+# Taille de page maximale de l'historique
+HISTORY_MAX_LIMIT = 500
+
+# Paramètres de l'historique: limit, before (curseur "date|id"), type, category, fields
+def parse_history_params(args):
+    params = {
+        'limit': None,
+        'before': None,
+        'type': args.get('type'),
+        'category': args.get('category'),
+        'balance_only': args.get('fields') == 'balance',
+        'archive': args.get('archive') == '1',
+        'columnar': wants_columnar(args)
+    }
+    
+    if params['type'] and params['type'] not in ('income', 'expense'):
+        raise ValueError("Le type doit être 'income' ou 'expense'")
+    
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('La limite doit être un entier')
+        if limit <= 0:
+            raise ValueError('La limite doit être positive')
+        params['limit'] = min(limit, HISTORY_MAX_LIMIT)
+    
+    before = args.get('before')
+    if before:
+        date, sep, row_id = before.rpartition('|')
+        if not sep or not row_id.isdigit():
+            raise ValueError('Curseur invalide')
+        params['before'] = (date, int(row_id))
+    
+    return params
+
+# Récupérer une page de l'historique (pagination par clé sur (date, id)),
+# archives comprises si archive=1. Renvoie la liste déjà encodée (RawJSON).
+def fetch_history(c, user_id, params):
+    conditions = "user_id = ?"
+    args = [user_id]
+    
+    if params['type']:
+        conditions += " AND type = ?"
+        args.append(params['type'])
+    if params['category']:
+        conditions += " AND category = ?"
+        args.append(params['category'])
+    if params['before']:
+        date, row_id = params['before']
+        conditions += " AND (date < ? OR (date = ? AND id < ?))"
+        args.extend([date, date, row_id])
+    
+    order = " ORDER BY date DESC, id DESC"
+    if params['limit']:
+        # Une ligne de plus pour savoir s'il reste une page
+        order += " LIMIT ?"
+        args.append(params['limit'] + 1)
+    
+    select = rows_select_sql('id', 'date', HISTORY_COLUMNS, params['columnar'])
+    
+    def build_query(schema):
+        return f"SELECT {select} FROM {schema}.transactions WHERE {conditions}{order}", args
+    
+    rows = fetch_with_archives(c.connection, build_query, 1, params['limit'], params['before'], params['archive'])
+    
+    next_cursor = None
+    if params['limit'] and len(rows) > params['limit']:
+        rows = rows[:params['limit']]
+        next_cursor = f"{rows[-1][1]}|{rows[-1][0]}"
+    
+    return encode_rows(rows, HISTORY_COLUMNS, params['columnar']), next_cursor
+
+@bp.route('/get_balance/<phone_number>', methods=['GET'])
 def get_balance(phone_number):
+    try:
+        params = parse_history_params(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
     # Vérifier que l'utilisateur existe
     user_id = get_user_id(phone_number)
     if not user_id:
@@ -349,60 +2693,158 @@ def get_balance(phone_number):
         }), 404
     
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
-        # Calculer le solde
+        # Lire le solde et la version: si le client a déjà cette version, rien d'autre à lire
+        balance, version = get_balance_version(c, user_id)
+        tag = f'u{user_id}-{version}'
+        cached = not_modified(tag)
+        if cached:
+            return cached
+        
+        # Mode solde seul: pas d'historique
+        if params['balance_only']:
+            return with_etag(jsonify({
+                'status': 'success',
+                'data': {
+                    'balance': balance
+                }
+            }), tag), 200
+        
+        # Récupérer les transactions
+        transactions, next_cursor = fetch_history(c, user_id, params)
+        
+        data = {
+            'balance': balance,
+            'transactions': transactions
+        }
+        if params['limit']:
+            data['next_cursor'] = next_cursor
+        
+        return with_etag(success_response(data), tag), 200
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Erreur lors de la récupération du solde: {str(e)}'
+        }), 500
+
+# Statistiques d'un utilisateur, lues dans les agrégats (sans parcourir l'historique)
+@bp.route('/stats/<phone_number>', methods=['GET'])
+def get_stats(phone_number):
+    period_kind = request.args.get('period', 'month')
+    if period_kind not in ROLLUP_PERIODS:
+        return jsonify({
+            'status': 'error',
+            'message': "La période doit être 'month' ou 'week'"
+        }), 400
+    
+    # Vérifier que l'utilisateur existe
+    user_id = get_user_id(phone_number)
+    if not user_id:
+        return jsonify({
+            'status': 'error',
+            'message': 'Aucun utilisateur trouvé avec ce numéro de téléphone'
+        }), 404
+    
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Solde, version et agrégats lus dans un même instantané: la version renvoyée
+        # (ETag, et repère des notifications dans la page) couvre exactement ces totaux
+        c.execute("BEGIN")
+        balance, version = get_balance_version(c, user_id)
+        tag = f'u{user_id}-{version}'
+        cached = not_modified(tag)
+        if cached:
+            conn.rollback()
+            return cached
+        
+        # Totaux par période et solde cumulé en fin de période
         c.execute("""
-            SELECT 
-                COALESCE(SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END), 0) -
-                COALESCE(SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END), 0) as balance
-            FROM transactions 
-            WHERE user_id = ?
-        """, (user_id,))
-        balance = c.fetchone()[0]
+            SELECT period, income, expense, income - expense,
+                   SUM(income - expense) OVER (ORDER BY period)
+            FROM (
+                SELECT period,
+                       SUM(CASE WHEN type = 'income' THEN total ELSE 0 END) AS income,
+                       SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END) AS expense
+                FROM ledger_rollups
+                WHERE user_id = ? AND period_kind = ?
+                GROUP BY period
+            )
+            ORDER BY period
+        """, (user_id, period_kind))
+        
+        periods = []
+        for row in c.fetchall():
+            periods.append({
+                'period': row[0],
+                'income': row[1],
+                'expense': row[2],
+                'net': row[3],
+                'running_balance': row[4]
+            })
         
-        # Récupérer les transactions
+        # Totaux par catégorie sur tout l'historique
         c.execute("""
-            SELECT type, amount, category, note, date 
-            FROM transactions 
-            WHERE user_id = ? 
-            ORDER BY date DESC
+            SELECT type, category, SUM(total), SUM(count)
+            FROM ledger_rollups
+            WHERE user_id = ? AND period_kind = 'month'
+            GROUP BY type, category
+            ORDER BY type, SUM(total) DESC
         """, (user_id,))
         
-        transactions = []
+        categories = []
+        income_total = 0
+        expense_total = 0
+        transaction_count = 0
         for row in c.fetchall():
-            transactions.append({
+            categories.append({
                 'type': row[0],
-                'amount': row[1],
-                'category': row[2],
-                'note': row[3],
-                'date': row[4]
+                'category': row[1],
+                'total': row[2],
+                'count': row[3]
             })
+            if row[0] == 'income':
+                income_total += row[2]
+            else:
+                expense_total += row[2]
+            transaction_count += row[3]
+        conn.commit()
         
-        conn.close()
-        
-        return jsonify({
+        return with_etag(jsonify({
             'status': 'success',
             'data': {
                 'balance': balance,
-                'transactions': transactions
+                'version': version,
+                'income_total': income_total,
+                'expense_total': expense_total,
+                'transaction_count': transaction_count,
+                'periods': periods,
+                'categories': categories
             }
-        }), 200
+        }), tag), 200
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors de la récupération du solde: {str(e)}'
+            'message': f'Erreur lors de la récupération des statistiques: {str(e)}'
         }), 500
 
-@app.route('/pending_deposits/<phone_number>', methods=['GET'])
+@bp.route('/pending_deposits/<phone_number>', methods=['GET'])
 def get_pending_deposits(phone_number):
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
-        c.execute("SELECT amount, source, note, date FROM pending_deposits WHERE phone_number = ?", (phone_number,))
+        tag = get_table_versions_tag(c, ('pending_deposits',))
+        cached = not_modified(tag)
+        if cached:
+            return cached
+        
+        c.execute("SELECT amount, source, note, date FROM pending_deposits WHERE phone_key = ?", (phone_key(phone_number),))
         
         deposits = []
         for row in c.fetchall():
@@ -413,15 +2855,13 @@ def get_pending_deposits(phone_number):
                 'date': row[3]
             })
         
-        conn.close()
-        
-        return jsonify({
+        return with_etag(jsonify({
             'status': 'success',
             'data': {
                 'pending_deposits': deposits,
                 'count': len(deposits)
             }
-        }), 200
+        }), tag), 200
         
     except Exception as e:
         return jsonify({
@@ -430,7 +2870,8 @@ def get_pending_deposits(phone_number):
         }), 500
 
 # Demande de dépôt Orange Money
-@app.route('/request_deposit', methods=['POST'])
+@bp.route('/request_deposit', methods=['POST'])
+@idempotent
 def request_deposit():
     data = request.get_json()
     
@@ -445,8 +2886,16 @@ def request_deposit():
             'message': 'Le numéro de téléphone, le montant et la preuve de transaction sont requis'
         }), 400
     
+    key = phone_key(phone_number)
+    if key is None:
+        return jsonify({
+            'status': 'error',
+            'message': INVALID_PHONE_NUMBER_MESSAGE
+        }), 400
+    phone_number = format_phone_number(key)
+    
     try:
-        amount = float(amount)
+        amount = parse_amount(amount)
         if amount <= 0:
             return jsonify({
                 'status': 'error',
@@ -458,18 +2907,20 @@ def request_deposit():
             'message': 'Le montant doit être un nombre valide'
         }), 400
     
-    try:
-        conn = sqlite3.connect('saveup_bf.db')
-        c = conn.cursor()
-        
-        # Créer la demande de dépôt
+    # Créer la demande de dépôt et la signaler aux administrateurs
+    def create_deposit_request(c):
         c.execute(
-            "INSERT INTO deposit_requests (phone_number, amount, transaction_proof) VALUES (?, ?, ?)",
-            (phone_number, amount, transaction_proof)
+            "INSERT INTO deposit_requests (phone_number, phone_key, amount, transaction_proof) VALUES (?, ?, ?, ?)",
+            (phone_number, key, amount, transaction_proof)
         )
-        
-        conn.commit()
-        conn.close()
+        publish_events(c, [(ADMIN_CHANNEL, 'deposit_request', {
+            'id': c.lastrowid,
+            'phone_number': phone_number,
+            'amount': amount
+        })])
+    
+    try:
+        run_write(create_deposit_request)
         
         return jsonify({
             'status': 'success',
@@ -483,7 +2934,8 @@ def request_deposit():
         }), 500
 
 # Demande de retrait
-@app.route('/request_withdraw', methods=['POST'])
+@bp.route('/request_withdraw', methods=['POST'])
+@idempotent
 def request_withdraw():
     data = request.get_json()
     
@@ -499,7 +2951,7 @@ def request_withdraw():
         }), 400
     
     try:
-        amount = float(amount)
+        amount = parse_amount(amount)
         if amount <= 0:
             return jsonify({
                 'status': 'error',
@@ -519,35 +2971,29 @@ def request_withdraw():
             'message': 'Aucun utilisateur trouvé avec ce numéro de téléphone'
         }), 404
     
-    # Vérifier que le solde est suffisant
+    # Réserver le montant sur le solde disponible puis créer la demande, dans la même écriture
+    def create_withdraw_request(c):
+        if not hold_balance(c, user_id, amount):
+            return False
+        c.execute(
+            "INSERT INTO withdraw_requests (user_id, amount, transaction_proof) VALUES (?, ?, ?)",
+            (user_id, amount, transaction_proof)
+        )
+        publish_events(c, [(ADMIN_CHANNEL, 'withdraw_request', {
+            'id': c.lastrowid,
+            'phone_number': format_phone_number(phone_key(phone_number)),
+            'amount': amount
+        })])
+        publish_balances(c, [user_id])
+        return True
+    
     try:
-        conn = sqlite3.connect('saveup_bf.db')
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT 
-                COALESCE(SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END), 0) -
-                COALESCE(SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END), 0) as balance
-            FROM transactions 
-            WHERE user_id = ?
-        """, (user_id,))
-        balance = c.fetchone()[0]
-        
-        if balance < amount:
+        if not run_write(create_withdraw_request):
             return jsonify({
                 'status': 'error',
                 'message': 'Solde insuffisant pour effectuer ce retrait'
             }), 400
         
-        # Créer la demande de retrait
-        c.execute(
-            "INSERT INTO withdraw_requests (user_id, amount, transaction_proof) VALUES (?, ?, ?)",
-            (user_id, amount, transaction_proof)
-        )
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({
             'status': 'success',
             'message': 'Demande de retrait envoyée avec succès. Elle sera traitée par un administrateur.'
@@ -561,42 +3007,157 @@ def request_withdraw():
 
 # Endpoints d'administration
 
-# Voir toutes les demandes de dépôt
-@app.route('/admin/deposits', methods=['GET'])
+# Taille de page par défaut et maximale des files d'administration
+ADMIN_QUEUE_DEFAULT_LIMIT = 100
+ADMIN_QUEUE_MAX_LIMIT = 500
+
+# Convertir une date ISO en borne comparable à created_at (YYYY-MM-DD HH:MM:SS).
+# Une date seule comme borne haute couvre toute la journée.
+def parse_created_at_bound(value, upper):
+    date = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    if upper and len(value) == 10:
+        return date.strftime('%Y-%m-%d 23:59:59.999999')
+    return date.strftime('%Y-%m-%d %H:%M:%S')
+
+# Paramètres des files: status (défaut 'pending', 'all' pour tout), from, to, limit, before ("created_at|id"),
+# archive=1 pour lire aussi les demandes traitées archivées
+def parse_admin_queue_params(args):
+    status = args.get('status', 'pending')
+    if status not in ('pending', 'approved', 'rejected', 'all'):
+        raise ValueError("Le statut doit être 'pending', 'approved', 'rejected' ou 'all'")
+    
+    params = {
+        'status': None if status == 'all' else status,
+        'from': None,
+        'to': None,
+        'limit': ADMIN_QUEUE_DEFAULT_LIMIT,
+        'before': None,
+        'archive': args.get('archive') == '1',
+        'columnar': wants_columnar(args)
+    }
+    
+    try:
+        if args.get('from'):
+            params['from'] = parse_created_at_bound(args['from'], upper=False)
+        if args.get('to'):
+            params['to'] = parse_created_at_bound(args['to'], upper=True)
+    except ValueError:
+        raise ValueError('Format de date invalide. Utilisez le format ISO (YYYY-MM-DD)')
+    
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('La limite doit être un entier')
+        if limit <= 0:
+            raise ValueError('La limite doit être positive')
+        params['limit'] = min(limit, ADMIN_QUEUE_MAX_LIMIT)
+    
+    before = args.get('before')
+    if before:
+        created_at, sep, row_id = before.rpartition('|')
+        if not sep or not row_id.isdigit():
+            raise ValueError('Curseur invalide')
+        params['before'] = (created_at, int(row_id))
+    
+    return params
+
+# Clause WHERE / ORDER BY / LIMIT d'une file pour l'alias de table donné
+def admin_queue_clause(alias, params):
+    conditions = []
+    args = []
+    
+    if params['status']:
+        conditions.append(f"{alias}.status = ?")
+        args.append(params['status'])
+    if params['from']:
+        conditions.append(f"{alias}.created_at >= ?")
+        args.append(params['from'])
+    if params['to']:
+        conditions.append(f"{alias}.created_at <= ?")
+        args.append(params['to'])
+    if params['before']:
+        created_at, row_id = params['before']
+        conditions.append(f"({alias}.created_at < ? OR ({alias}.created_at = ? AND {alias}.id < ?))")
+        args.extend([created_at, created_at, row_id])
+    
+    clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Une ligne de plus pour savoir s'il reste une page
+    clause += f" ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT ?"
+    args.append(params['limit'] + 1)
+    
+    return clause, args
+
+# Colonnes renvoyées par les files d'administration
+DEPOSIT_REQUEST_COLUMNS = [
+    ('id', 'dr.id'),
+    ('phone_number', 'dr.phone_number'),
+    ('amount', 'dr.amount'),
+    ('transaction_proof', 'dr.transaction_proof'),
+    ('status', 'dr.status'),
+    ('created_at', 'dr.created_at'),
+    ('processed_at', 'dr.processed_at'),
+    ('user_name', "COALESCE(u.name, 'Utilisateur non enregistré')")
+]
+
+WITHDRAW_REQUEST_COLUMNS = [
+    ('id', 'wr.id'),
+    ('phone_number', 'u.phone_number'),
+    ('user_name', 'u.name'),
+    ('amount', 'wr.amount'),
+    ('transaction_proof', 'wr.transaction_proof'),
+    ('status', 'wr.status'),
+    ('created_at', 'wr.created_at'),
+    ('processed_at', 'wr.processed_at')
+]
+
+# Couper la ligne sentinelle et calculer le curseur suivant
+def paginate_admin_queue(rows, params, created_at_index):
+    if len(rows) > params['limit']:
+        rows = rows[:params['limit']]
+        return rows, f"{rows[-1][created_at_index]}|{rows[-1][0]}"
+    return rows, None
+
+# Voir les demandes de dépôt (par défaut: en attente)
+@bp.route('/admin/deposits', methods=['GET'])
 def admin_get_deposits():
     try:
-        conn = sqlite3.connect('saveup_bf.db')
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT dr.id, dr.phone_number, dr.amount, dr.transaction_proof, dr.status, dr.created_at, dr.processed_at, u.name
-            FROM deposit_requests dr
-            LEFT JOIN users u ON dr.phone_number = u.phone_number
-            ORDER BY dr.created_at DESC
-        """)
-        
-        deposits = []
-        for row in c.fetchall():
-            deposits.append({
-                'id': row[0],
-                'phone_number': row[1],
-                'amount': row[2],
-                'transaction_proof': row[3],
-                'status': row[4],
-                'created_at': row[5],
-                'processed_at': row[6],
-                'user_name': row[7] or 'Utilisateur non enregistré'
-            })
-        
-        conn.close()
-        
+        params = parse_admin_queue_params(request.args)
+    except ValueError as e:
         return jsonify({
-            'status': 'success',
-            'data': {
-                'deposits': deposits,
-                'count': len(deposits)
-            }
-        }), 200
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    try:
+        conn = get_db()
+        
+        tag = get_table_versions_tag(conn.cursor(), ('deposit_requests', 'users'))
+        cached = not_modified(tag)
+        if cached:
+            return cached
+        
+        clause, args = admin_queue_clause('dr', params)
+        select = rows_select_sql('dr.id', 'dr.created_at', DEPOSIT_REQUEST_COLUMNS, params['columnar'])
+        
+        # Les archives n'ont pas de colonne phone_key: la clé y est calculée
+        def build_query(schema):
+            key = 'dr.phone_key' if schema == 'main' else phone_key_sql('dr.phone_number')
+            return f"""
+                SELECT {select}
+                FROM {schema}.deposit_requests dr
+                LEFT JOIN main.users u ON u.phone_key = {key}
+            """ + clause, args
+        
+        rows = fetch_with_archives(conn, build_query, 1, params['limit'], params['before'], params['archive'])
+        rows, next_cursor = paginate_admin_queue(rows, params, 1)
+        
+        return with_etag(success_response({
+            'deposits': encode_rows(rows, DEPOSIT_REQUEST_COLUMNS, params['columnar']),
+            'count': len(rows),
+            'next_cursor': next_cursor
+        }), tag), 200
         
     except Exception as e:
         return jsonify({
@@ -604,42 +3165,43 @@ def admin_get_deposits():
             'message': f'Erreur lors de la récupération des demandes de dépôt: {str(e)}'
         }), 500
 
-# Voir toutes les demandes de retrait
-@app.route('/admin/withdraws', methods=['GET'])
+# Voir les demandes de retrait (par défaut: en attente)
+@bp.route('/admin/withdraws', methods=['GET'])
 def admin_get_withdraws():
     try:
-        conn = sqlite3.connect('saveup_bf.db')
-        c = conn.cursor()
+        params = parse_admin_queue_params(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    try:
+        conn = get_db()
         
-        c.execute("""
-            SELECT wr.id, u.phone_number, u.name, wr.amount, wr.transaction_proof, wr.status, wr.created_at, wr.processed_at
-            FROM withdraw_requests wr
-            JOIN users u ON wr.user_id = u.id
-            ORDER BY wr.created_at DESC
-        """)
+        tag = get_table_versions_tag(conn.cursor(), ('withdraw_requests',))
+        cached = not_modified(tag)
+        if cached:
+            return cached
         
-        withdraws = []
-        for row in c.fetchall():
-            withdraws.append({
-                'id': row[0],
-                'phone_number': row[1],
-                'user_name': row[2],
-                'amount': row[3],
-                'transaction_proof': row[4],
-                'status': row[5],
-                'created_at': row[6],
-                'processed_at': row[7]
-            })
+        clause, args = admin_queue_clause('wr', params)
+        select = rows_select_sql('wr.id', 'wr.created_at', WITHDRAW_REQUEST_COLUMNS, params['columnar'])
         
-        conn.close()
+        def build_query(schema):
+            return f"""
+                SELECT {select}
+                FROM {schema}.withdraw_requests wr
+                JOIN main.users u ON wr.user_id = u.id
+            """ + clause, args
         
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'withdraws': withdraws,
-                'count': len(withdraws)
-            }
-        }), 200
+        rows = fetch_with_archives(conn, build_query, 1, params['limit'], params['before'], params['archive'])
+        rows, next_cursor = paginate_admin_queue(rows, params, 1)
+        
+        return with_etag(success_response({
+            'withdraws': encode_rows(rows, WITHDRAW_REQUEST_COLUMNS, params['columnar']),
+            'count': len(rows),
+            'next_cursor': next_cursor
+        }), tag), 200
         
     except Exception as e:
         return jsonify({
@@ -647,160 +3209,577 @@ def admin_get_withdraws():
             'message': f'Erreur lors de la récupération des demandes de retrait: {str(e)}'
         }), 500
 
-# Approuver un dépôt
-@app.route('/admin/approve_deposit/<int:deposit_id>', methods=['POST'])
-def admin_approve_deposit(deposit_id):
+# Exports complets en flux (CSV ou NDJSON). Les lignes sont lues par paquets avec
+# fetchmany: la mémoire reste constante quelle que soit la taille de l'export.
+EXPORT_CHUNK_SIZE = 2000
+
+# table -> (colonnes, requête, colonne de date, colonne de la clé du numéro)
+EXPORTS = {
+    'transactions': (
+        ['id', 'phone_number', 'type', 'amount', 'category', 'note', 'date', 'created_at'],
+        """
+            SELECT t.id, u.phone_number, t.type, t.amount, t.category, t.note, t.date, t.created_at
+            FROM transactions t
+            JOIN users u ON t.user_id = u.id
+        """,
+        't.date',
+        'u.phone_key'
+    ),
+    'deposit_requests': (
+        ['id', 'phone_number', 'amount', 'transaction_proof', 'status', 'created_at', 'processed_at'],
+        """
+            SELECT dr.id, dr.phone_number, dr.amount, dr.transaction_proof, dr.status, dr.created_at, dr.processed_at
+            FROM deposit_requests dr
+        """,
+        'dr.created_at',
+        'dr.phone_key'
+    ),
+    'withdraw_requests': (
+        ['id', 'phone_number', 'amount', 'transaction_proof', 'status', 'created_at', 'processed_at'],
+        """
+            SELECT wr.id, u.phone_number, wr.amount, wr.transaction_proof, wr.status, wr.created_at, wr.processed_at
+            FROM withdraw_requests wr
+            JOIN users u ON wr.user_id = u.id
+        """,
+        'wr.created_at',
+        'u.phone_key'
+    )
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Valider les filtres d'export: from, to (ISO) et phone_number
+def parse_export_params(date_from, date_to, phone_number):
+    key = None
+    if phone_number:
+        key = phone_key(phone_number)
+        if key is None:
+            raise ValueError(INVALID_PHONE_NUMBER_MESSAGE)
+    
+    try:
+        return {
+            'from': parse_created_at_bound(date_from, upper=False) if date_from else None,
+            'to': parse_created_at_bound(date_to, upper=True) if date_to else None,
+            'phone_key': key
+        }
+    except ValueError:
+        raise ValueError('Format de date invalide. Utilisez le format ISO (YYYY-MM-DD)')
+
+# Générer l'export par morceaux de texte. Une connexion dédiée est ouverte pour la
+# durée du flux afin de ne pas retenir celle du thread.
+def iter_export(table, export_format, params):
+    columns, query, date_column, phone_key_column = EXPORTS[table]
+    
+    conditions = []
+    args = []
+    if params['from']:
+        conditions.append(f"{date_column} >= ?")
+        args.append(params['from'])
+    if params['to']:
+        conditions.append(f"{date_column} <= ?")
+        args.append(params['to'])
+    if params['phone_key']:
+        conditions.append(f"{phone_key_column} = ?")
+        args.append(params['phone_key'])
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY 1"
+    
+    conn = _connect(DATABASE)
     try:
-        conn = sqlite3.connect('saveup_bf.db')
         c = conn.cursor()
-        
-        # Récupérer les informations de la demande
-        c.execute("SELECT phone_number, amount FROM deposit_requests WHERE id = ?", (deposit_id,))
-        deposit = c.fetchone()
-        
-        if not deposit:
-            return jsonify({
-                'status': 'error',
-                'message': 'Demande de dépôt non trouvée'
-            }), 404
-        
-        phone_number, amount = deposit
-        
-        # Vérifier si l'utilisateur existe
-        user_id = get_user_id(phone_number)
-        
-        if user_id:
-            # Créditer le compte de l'utilisateur
-            c.execute(
-                "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, 'income', ?, 'Dépôt Orange Money', 'Dépôt approuvé par administrateur', ?)",
-                (user_id, amount, datetime.now())
-            )
+        c.execute(query, args)
+        
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue()
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(rows)
+                yield buffer.getvalue()
         else:
-            # Stocker en attente si l'utilisateur n'existe pas encore
-            c.execute(
-                "INSERT INTO pending_deposits (phone_number, amount, source, note, date) VALUES (?, ?, 'Dépôt Orange Money', 'Dépôt approuvé par administrateur', ?)",
-                (phone_number, amount, datetime.now())
-            )
-        
-        # Mettre à jour le statut de la demande
-        c.execute(
-            "UPDATE deposit_requests SET status = 'approved', processed_at = ? WHERE id = ?",
-            (datetime.now(), deposit_id)
-        )
-        
-        conn.commit()
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+    finally:
         conn.close()
-        
+
+# Exporter une table en flux: /admin/export/<table>?format=csv|ndjson&from=&to=&phone_number=
+@bp.route('/admin/export/<table>', methods=['GET'])
+def admin_export(table):
+    if table not in EXPORTS:
         return jsonify({
-            'status': 'success',
-            'message': 'Dépôt approuvé et compte crédité avec succès'
-        }), 200
-        
-    except Exception as e:
+            'status': 'error',
+            'message': f"Export inconnu. Choisissez parmi: {', '.join(EXPORTS)}"
+        }), 404
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors de l\'approbation du dépôt: {str(e)}'
-        }), 500
+            'message': "Le format doit être 'csv' ou 'ndjson'"
+        }), 400
+    
+    try:
+        params = parse_export_params(request.args.get('from'), request.args.get('to'), request.args.get('phone_number'))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    filename = f"{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(iter_export(table, export_format, params)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
-# Rejeter un dépôt
-@app.route('/admin/reject_deposit/<int:deposit_id>', methods=['POST'])
-def admin_reject_deposit(deposit_id):
+@bp.cli.command('export')
+@click.argument('table', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+@click.option('--from', 'date_from', help='Date de début (ISO)')
+@click.option('--to', 'date_to', help='Date de fin incluse (ISO)')
+@click.option('--phone-number', help="Limiter à un numéro d'utilisateur")
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='Fichier de sortie (défaut: sortie standard)')
+def export_command(table, export_format, date_from, date_to, phone_number, output):
+    """Exporte une table en CSV ou NDJSON, en flux."""
+    try:
+        params = parse_export_params(date_from, date_to, phone_number)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for chunk in iter_export(table, export_format, params):
+        output.write(chunk)
+
+# Nombre de demandes par statut pour chaque file
+@bp.route('/admin/summary', methods=['GET'])
+def admin_summary():
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
-        # Mettre à jour le statut de la demande
-        c.execute(
-            "UPDATE deposit_requests SET status = 'rejected', processed_at = ? WHERE id = ?",
-            (datetime.now(), deposit_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        summary = {}
+        for key, table in (('deposits', 'deposit_requests'), ('withdraws', 'withdraw_requests')):
+            counts = {'pending': 0, 'approved': 0, 'rejected': 0}
+            c.execute(f"SELECT status, COUNT(*) FROM {table} GROUP BY status")
+            counts.update(c.fetchall())
+            summary[key] = counts
+        summary['pending_deposits'] = pending_deposit_ages(c)
         
         return jsonify({
             'status': 'success',
-            'message': 'Dépôt rejeté avec succès'
+            'data': summary
         }), 200
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors du rejet du dépôt: {str(e)}'
+            'message': f'Erreur lors de la récupération du résumé: {str(e)}'
         }), 500
 
-# Approuver un retrait
-@app.route('/admin/approve_withdraw/<int:withdraw_id>', methods=['POST'])
-def admin_approve_withdraw(withdraw_id):
+# Lire des demandes par identifiant, par tranches IN: {id: ligne}
+def fetch_requests_by_id(c, table, columns, ids):
+    rows = {}
+    for i in range(0, len(ids), SQL_IN_CHUNK_SIZE):
+        chunk = ids[i:i + SQL_IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f"SELECT id, {columns} FROM {table} WHERE id IN ({placeholders})", chunk)
+        for row in c.fetchall():
+            rows[row[0]] = row[1:]
+    return rows
+
+# Approuver ou rejeter des demandes de dépôt dans la transaction courante.
+# Seules les demandes 'pending' sont traitées: relancer le même lot est sans effet.
+# Renvoie {id: 'approved' | 'rejected' | 'not_found' | 'already_processed'}
+def process_deposit_requests(c, ids, approve):
+    requests = fetch_requests_by_id(c, 'deposit_requests', 'phone_number, phone_key, amount, status', ids)
+    
+    outcomes = {}
+    to_process = []
+    for deposit_id in ids:
+        if deposit_id not in requests:
+            outcomes[deposit_id] = 'not_found'
+        elif requests[deposit_id][3] != 'pending' or deposit_id in outcomes:
+            outcomes.setdefault(deposit_id, 'already_processed')
+        else:
+            outcomes[deposit_id] = 'approved' if approve else 'rejected'
+            to_process.append(deposit_id)
+    
+    now = datetime.now()
+    if approve and to_process:
+        user_ids = get_user_ids(requests[i][1] for i in to_process)
+        transactions = []
+        pending = []
+        for deposit_id in to_process:
+            phone_number, key, amount, _ = requests[deposit_id]
+            user_id = user_ids.get(key)
+            if user_id:
+                # Créditer le compte de l'utilisateur
+                transactions.append((user_id, 'income', amount, 'Dépôt Orange Money', 'Dépôt approuvé par administrateur', now))
+            else:
+                # Stocker en attente si l'utilisateur n'existe pas encore
+                pending.append((phone_number, key, amount, 'Dépôt Orange Money', 'Dépôt approuvé par administrateur', now))
+        record_transactions(c, transactions)
+        if pending:
+            c.executemany(
+                "INSERT INTO pending_deposits (phone_number, phone_key, amount, source, note, date) VALUES (?, ?, ?, ?, ?, ?)",
+                pending
+            )
+    
+    # Mettre à jour le statut des demandes
+    c.executemany(
+        "UPDATE deposit_requests SET status = ?, processed_at = ? WHERE id = ? AND status = 'pending'",
+        [('approved' if approve else 'rejected', now, deposit_id) for deposit_id in to_process]
+    )
+    publish_events(c, [
+        (ADMIN_CHANNEL, 'request_processed', {'kind': 'deposit', 'id': i, 'status': outcomes[i]})
+        for i in to_process
+    ])
+    
+    return outcomes
+
+# Lire les soldes de plusieurs utilisateurs, par tranches IN: {user_id: balance}
+def fetch_balances(c, user_ids):
+    user_ids = list(user_ids)
+    balances = {}
+    for i in range(0, len(user_ids), SQL_IN_CHUNK_SIZE):
+        chunk = user_ids[i:i + SQL_IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        c.execute(f"SELECT user_id, balance FROM balances WHERE user_id IN ({placeholders})", chunk)
+        balances.update(c.fetchall())
+    return balances
+
+# Approuver ou rejeter des demandes de retrait dans la transaction courante (même contrat,
+# plus 'insufficient_balance' pour une approbation que le solde ne couvre plus).
+# La réservation de chaque demande traitée est libérée.
+def process_withdraw_requests(c, ids, approve):
+    requests = fetch_requests_by_id(c, 'withdraw_requests', 'user_id, amount, status', ids)
+    
+    outcomes = {}
+    to_process = []
+    for withdraw_id in ids:
+        if withdraw_id not in requests:
+            outcomes[withdraw_id] = 'not_found'
+        elif requests[withdraw_id][2] != 'pending' or withdraw_id in outcomes:
+            outcomes.setdefault(withdraw_id, 'already_processed')
+        else:
+            outcomes[withdraw_id] = 'approved' if approve else 'rejected'
+            to_process.append(withdraw_id)
+    
+    if approve:
+        # Revérifier le solde avant de débiter: les demandes d'un même utilisateur sont
+        # imputées dans l'ordre, celles qui ne passent plus restent en attente
+        balances = fetch_balances(c, {requests[i][0] for i in to_process})
+        approved = []
+        for withdraw_id in to_process:
+            user_id, amount, _ = requests[withdraw_id]
+            if balances.get(user_id, 0) < amount:
+                outcomes[withdraw_id] = 'insufficient_balance'
+            else:
+                balances[user_id] -= amount
+                approved.append(withdraw_id)
+        to_process = approved
+    
+    now = datetime.now()
+    release_holds(c, [(requests[i][0], requests[i][1]) for i in to_process])
+    if approve:
+        # Débiter le compte de l'utilisateur
+        record_transactions(c, [
+            (requests[i][0], 'expense', requests[i][1], 'Retrait', 'Retrait approuvé par administrateur', now)
+            for i in to_process
+        ])
+    
+    # Mettre à jour le statut des demandes
+    c.executemany(
+        "UPDATE withdraw_requests SET status = ?, processed_at = ? WHERE id = ? AND status = 'pending'",
+        [('approved' if approve else 'rejected', now, withdraw_id) for withdraw_id in to_process]
+    )
+    if not approve:
+        # Réservations libérées: le solde disponible remonte
+        publish_balances(c, {requests[i][0] for i in to_process})
+    publish_events(c, [
+        (ADMIN_CHANNEL, 'request_processed', {'kind': 'withdraw', 'id': i, 'status': outcomes[i]})
+        for i in to_process
+    ])
+    
+    return outcomes
+
+# Traiter une seule demande et traduire le résultat en réponse HTTP
+def process_single_request(process, request_id, approve, not_found_message, success_message, error_label):
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
-        # Récupérer les informations de la demande
-        c.execute("SELECT user_id, amount FROM withdraw_requests WHERE id = ?", (withdraw_id,))
-        withdraw = c.fetchone()
+        c.execute("BEGIN IMMEDIATE")
+        outcome = process(c, [request_id], approve)[request_id]
+        conn.commit()
         
-        if not withdraw:
+        if outcome == 'not_found':
             return jsonify({
                 'status': 'error',
-                'message': 'Demande de retrait non trouvée'
+                'message': not_found_message
             }), 404
         
-        user_id, amount = withdraw
-        
-        # Débiter le compte de l'utilisateur
-        c.execute(
-            "INSERT INTO transactions (user_id, type, amount, category, note, date) VALUES (?, 'expense', ?, 'Retrait', 'Retrait approuvé par administrateur', ?)",
-            (user_id, amount, datetime.now())
-        )
-        
-        # Mettre à jour le statut de la demande
-        c.execute(
-            "UPDATE withdraw_requests SET status = 'approved', processed_at = ? WHERE id = ?",
-            (datetime.now(), withdraw_id)
-        )
+        if outcome == 'already_processed':
+            return jsonify({
+                'status': 'error',
+                'message': 'Cette demande a déjà été traitée'
+            }), 409
         
-        conn.commit()
-        conn.close()
+        if outcome == 'insufficient_balance':
+            return jsonify({
+                'status': 'error',
+                'message': 'Solde insuffisant pour approuver ce retrait'
+            }), 409
         
         return jsonify({
             'status': 'success',
-            'message': 'Retrait approuvé et compte débité avec succès'
+            'message': success_message
         }), 200
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors de l\'approbation du retrait: {str(e)}'
+            'message': f'{error_label}: {str(e)}'
         }), 500
 
+# Approuver un dépôt
+@bp.route('/admin/approve_deposit/<int:deposit_id>', methods=['POST'])
+def admin_approve_deposit(deposit_id):
+    return process_single_request(
+        process_deposit_requests, deposit_id, True,
+        'Demande de dépôt non trouvée',
+        'Dépôt approuvé et compte crédité avec succès',
+        'Erreur lors de l\'approbation du dépôt'
+    )
+
+# Rejeter un dépôt
+@bp.route('/admin/reject_deposit/<int:deposit_id>', methods=['POST'])
+def admin_reject_deposit(deposit_id):
+    return process_single_request(
+        process_deposit_requests, deposit_id, False,
+        'Demande de dépôt non trouvée',
+        'Dépôt rejeté avec succès',
+        'Erreur lors du rejet du dépôt'
+    )
+
+# Approuver un retrait
+@bp.route('/admin/approve_withdraw/<int:withdraw_id>', methods=['POST'])
+def admin_approve_withdraw(withdraw_id):
+    return process_single_request(
+        process_withdraw_requests, withdraw_id, True,
+        'Demande de retrait non trouvée',
+        'Retrait approuvé et compte débité avec succès',
+        'Erreur lors de l\'approbation du retrait'
+    )
+
 # Rejeter un retrait
-@app.route('/admin/reject_withdraw/<int:withdraw_id>', methods=['POST'])
+@bp.route('/admin/reject_withdraw/<int:withdraw_id>', methods=['POST'])
 def admin_reject_withdraw(withdraw_id):
+    return process_single_request(
+        process_withdraw_requests, withdraw_id, False,
+        'Demande de retrait non trouvée',
+        'Retrait rejeté avec succès',
+        'Erreur lors du rejet du retrait'
+    )
+
+# Nombre maximal de demandes par lot d'administration
+ADMIN_BATCH_MAX_IDS = 1000
+
+# Traiter un lot de demandes: {"action": "approve" | "reject", "ids": [...]}
+def process_batch_request(process, error_label):
+    data = request.get_json()
+    
+    action = data.get('action') if isinstance(data, dict) else None
+    ids = data.get('ids') if isinstance(data, dict) else None
+    
+    if action not in ('approve', 'reject'):
+        return jsonify({
+            'status': 'error',
+            'message': "L'action doit être 'approve' ou 'reject'"
+        }), 400
+    
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({
+            'status': 'error',
+            'message': 'Une liste d\'identifiants entiers est requise'
+        }), 400
+    
+    if len(ids) > ADMIN_BATCH_MAX_IDS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Au plus {ADMIN_BATCH_MAX_IDS} demandes par lot'
+        }), 400
+    
     try:
-        conn = sqlite3.connect('saveup_bf.db')
+        conn = get_db()
         c = conn.cursor()
         
-        # Mettre à jour le statut de la demande
-        c.execute(
-            "UPDATE withdraw_requests SET status = 'rejected', processed_at = ? WHERE id = ?",
-            (datetime.now(), withdraw_id)
-        )
-        
+        # Tout le lot dans une seule transaction
+        c.execute("BEGIN IMMEDIATE")
+        outcomes = process(c, ids, action == 'approve')
         conn.commit()
-        conn.close()
+        
+        processed = sum(1 for outcome in outcomes.values() if outcome in ('approved', 'rejected'))
         
         return jsonify({
             'status': 'success',
-            'message': 'Retrait rejeté avec succès'
+            'message': f'{processed} demande(s) traitée(s)',
+            'data': {
+                'processed': processed,
+                'results': [{'id': i, 'outcome': outcome} for i, outcome in outcomes.items()]
+            }
         }), 200
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erreur lors du rejet du retrait: {str(e)}'
+            'message': f'{error_label}: {str(e)}'
         }), 500
 
+# Approuver ou rejeter plusieurs dépôts
+@bp.route('/admin/deposits/batch', methods=['POST'])
+def admin_batch_deposits():
+    return process_batch_request(process_deposit_requests, 'Erreur lors du traitement des dépôts')
+
+# Approuver ou rejeter plusieurs retraits
+@bp.route('/admin/withdraws/batch', methods=['POST'])
+def admin_batch_withdraws():
+    return process_batch_request(process_withdraw_requests, 'Erreur lors du traitement des retraits')
+
+# Interface web: templates/index.html est servie par l'application. Au démarrage, le CSS
+# et le JS en ligne sont extraits dans des fichiers nommés d'après leur empreinte
+# (app.<empreinte>.css / .js), compressés une seule fois (gzip, brotli) et servis avec
+# un cache d'un an: un nouveau contenu change l'URL. La page elle-même est revalidée
+# par ETag. SAVEUP_API_BASE_URL: adresse de l'API vue par la page (vide: même origine).
+API_BASE_URL = os.environ.get('SAVEUP_API_BASE_URL', '')
+ASSET_URL_PREFIX = '/assets/'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+INLINE_STYLE_RE = re.compile(r'^([ \t]*)<style>\n(.*?)\n[ \t]*</style>$', re.M | re.S)
+INLINE_SCRIPT_RE = re.compile(r'^([ \t]*)<script>\n(.*?)\n[ \t]*</script>$', re.M | re.S)
+API_BASE_URL_META_RE = re.compile(r'(<meta name="api-base-url" content=")[^"]*(")')
+
+# Contenu statique et ses variantes précompressées (compression maximale, faite une fois)
+class StaticAsset:
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        # mtime=0: mêmes octets dans tous les workers et à chaque construction
+        self.bodies = {None: body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+    
+    def response(self, cache_control):
+        response = not_modified(self.etag)
+        if response is None:
+            encoding = negotiate_encoding(self.bodies)
+            response = Response(self.bodies[encoding], mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.set_etag(self.etag, weak=encoding is not None)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+# Extraire le CSS et le JS en ligne de la page: renvoie (page, {nom de fichier: StaticAsset})
+def build_frontend(root_path, api_base_url=API_BASE_URL):
+    with open(os.path.join(root_path, 'templates', 'index.html'), encoding='utf-8') as f:
+        page = f.read()
+    
+    assets = {}
+    
+    def extract(pattern, extension, mimetype, tag):
+        nonlocal page
+        match = pattern.search(page)
+        if match is None:
+            return
+        asset = StaticAsset(match.group(2).encode() + b'\n', mimetype)
+        name = f'app.{asset.etag}.{extension}'
+        assets[name] = asset
+        page = page[:match.start()] + match.group(1) + tag.format(url=ASSET_URL_PREFIX + name) + page[match.end():]
+    
+    extract(INLINE_STYLE_RE, 'css', 'text/css', '<link rel="stylesheet" href="{url}">')
+    extract(INLINE_SCRIPT_RE, 'js', 'application/javascript', '<script src="{url}"></script>')
+    page = API_BASE_URL_META_RE.sub(lambda m: m.group(1) + html.escape(api_base_url) + m.group(2), page)
+    
+    return StaticAsset(page.encode(), 'text/html'), assets
+
+# Page et fichiers construits par create_app()
+_frontend = None
+
+def load_frontend(root_path):
+    global _frontend
+    try:
+        _frontend = build_frontend(root_path)
+    except FileNotFoundError:
+        logging.getLogger('saveup.frontend').warning("templates/index.html introuvable: interface web désactivée")
+        _frontend = None
+
+@bp.route('/', methods=['GET'])
+def index():
+    if _frontend is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Interface web indisponible'
+        }), 404
+    
+    return _frontend[0].response('no-cache')
+
+@bp.route(ASSET_URL_PREFIX + '<name>', methods=['GET'])
+def frontend_asset(name):
+    asset = _frontend[1].get(name) if _frontend else None
+    if asset is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Fichier introuvable'
+        }), 404
+    
+    return asset.response(ASSET_CACHE_CONTROL)
+
+# Écrire la page, ses fichiers et leurs variantes .gz / .br dans un répertoire,
+# pour un hébergement statique ou un CDN
+@bp.cli.command('build-frontend')
+@click.argument('output_dir')
+@click.option('--api-base-url', default=API_BASE_URL, help="Adresse de l'API vue par la page (vide: même origine)")
+def build_frontend_command(output_dir, api_base_url):
+    """Génère la page web statique dans un dossier."""
+    page, assets = build_frontend(current_app.root_path, api_base_url)
+    os.makedirs(os.path.join(output_dir, ASSET_URL_PREFIX.strip('/')), exist_ok=True)
+    
+    files = [('index.html', page)] + [(ASSET_URL_PREFIX.strip('/') + '/' + name, asset) for name, asset in assets.items()]
+    for path, asset in files:
+        for encoding, body in asset.bodies.items():
+            suffix = {None: '', 'gzip': '.gz', 'br': '.br'}[encoding]
+            with open(os.path.join(output_dir, path + suffix), 'wb') as f:
+                f.write(body)
+        click.echo(f'{path}: {len(asset.bodies[None])} octets' + ''.join(
+            f', {encoding} {len(body)}' for encoding, body in asset.bodies.items() if encoding))
+
+# Fabrique de l'application. Les migrations ne sont pas lancées ici: en production
+# elles s'exécutent une seule fois, dans un processus lancé par le maître gunicorn
+# (gunicorn.conf.py), avant le démarrage des workers.
+def create_app():
+    app = Flask(__name__)
+    app.json = TimedJSONProvider(app)
+    CORS(app)  # Active CORS pour toutes les routes
+    app.register_blueprint(bp)
+    load_frontend(app.root_path)
+    start_reconciler()
+    return app
+
 if __name__ == '__main__':
+    # Serveur de développement
     init_db()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+import pytest
+
+# server lit SAVEUP_DB et SAVEUP_ARCHIVE_DIR à l'import: base temporaire pour toute la session
+_tmp = tempfile.mkdtemp(prefix='saveup-tests-')
+os.environ['SAVEUP_DB'] = os.path.join(_tmp, 'saveup.db')
+os.environ['SAVEUP_ARCHIVE_DIR'] = os.path.join(_tmp, 'archive')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+# Connexion sur une base vide, propre à chaque test, sans fichiers d'archive
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    conn = server._connect(str(tmp_path / 'migrate.db'))
+    yield conn
+    conn.close()
+
+
+# Appliquer les migrations jusqu'à `version` incluse
+def migrate_to(conn, version):
+    for number, migration in enumerate(server.MIGRATIONS[:version], start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        migration(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    server.init_db()
+    return server.create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Créer un utilisateur par l'API et renvoyer son identifiant. La base de session est
+# partagée: chaque test utilise ses propres numéros.
+@pytest.fixture
+def create_user(client):
+    def create(phone_number, name='Test'):
+        response = client.post('/create_user', json={'phone_number': phone_number, 'name': name})
+        assert response.status_code == 201
+        return response.get_json()['data']['user_id']
+    return create
+
+
+# Solde affiché d'un utilisateur
+@pytest.fixture
+def balance_of(client):
+    def balance(phone_number):
+        return client.get(f'/get_balance/{phone_number}?fields=balance').get_json()['data']['balance']
+    return balance
+
+
+# Exécuter du code dans un autre processus sur la même base, comme le ferait un autre
+# worker gunicorn: rien n'y est partagé avec le processus des tests (caches compris)
+def run_in_other_process(code):
+    subprocess.run(
+        [sys.executable, '-c', 'import server\n' + textwrap.dedent(code)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        check=True
+    )
@@ -0,0 +1,78 @@
+import server
+
+
+def deposit_request(client, phone, amount):
+    response = client.post('/request_deposit', json={'phone_number': phone, 'amount': amount, 'transaction_proof': 'OM1'})
+    assert response.status_code == 201
+    return server.get_db().execute(
+        "SELECT MAX(id) FROM deposit_requests WHERE phone_key = ?", (server.phone_key(phone),)
+    ).fetchone()[0]
+
+
+def batch(client, kind, action, ids):
+    return client.post(f'/admin/{kind}/batch', json={'action': action, 'ids': ids})
+
+
+def outcomes(response):
+    return [(r['id'], r['outcome']) for r in response.get_json()['data']['results']]
+
+
+def test_deposit_batch_is_idempotent(client, create_user, balance_of):
+    known, unknown = '22681000001', '22681000002'
+    create_user(known)
+    first = deposit_request(client, known, 500)
+    second = deposit_request(client, unknown, 300)
+    missing = second + 1000
+    
+    response = batch(client, 'deposits', 'approve', [first, second, first, missing])
+    assert response.status_code == 200
+    assert response.get_json()['data']['processed'] == 2
+    assert outcomes(response) == [(first, 'approved'), (second, 'approved'), (missing, 'not_found')]
+    assert balance_of(known) == 500
+    # Numéro sans compte: le dépôt approuvé attend l'inscription
+    assert [d['amount'] for d in client.get(f'/pending_deposits/{unknown}').get_json()['data']['pending_deposits']] == [300]
+    
+    # Rejouer le lot ne crédite rien une seconde fois
+    replay = batch(client, 'deposits', 'approve', [first, second])
+    assert replay.get_json()['data']['processed'] == 0
+    assert outcomes(replay) == [(first, 'already_processed'), (second, 'already_processed')]
+    assert balance_of(known) == 500
+    assert batch(client, 'deposits', 'reject', [first]).get_json()['data']['processed'] == 0
+
+
+def test_single_endpoints_answer_409_once_processed(client):
+    deposit_id = deposit_request(client, '22681000003', 100)
+    assert client.post(f'/admin/reject_deposit/{deposit_id}').status_code == 200
+    assert client.post(f'/admin/reject_deposit/{deposit_id}').status_code == 409
+    assert client.post(f'/admin/approve_deposit/{deposit_id}').status_code == 409
+    assert client.post(f'/admin/approve_deposit/{deposit_id + 1000}').status_code == 404
+
+
+def test_withdraw_batch_rejects_and_releases_holds(client, create_user, balance_of):
+    phone = '22681000004'
+    user_id = create_user(phone)
+    client.post('/add_income', json={'phone_number': phone, 'amount': 1000, 'source': 'Salaire'})
+    for amount in (100, 200):
+        assert client.post('/request_withdraw', json={'phone_number': phone, 'amount': amount}).status_code == 201
+    ids = [row[0] for row in server.get_db().execute(
+        "SELECT id FROM withdraw_requests WHERE user_id = ? ORDER BY id", (user_id,)
+    )]
+    
+    response = batch(client, 'withdraws', 'approve', ids[:1])
+    assert outcomes(response) == [(ids[0], 'approved')]
+    response = batch(client, 'withdraws', 'reject', ids)
+    assert outcomes(response) == [(ids[0], 'already_processed'), (ids[1], 'rejected')]
+    
+    db = server.get_db()
+    assert db.execute("SELECT balance, held FROM balances WHERE user_id = ?", (user_id,)).fetchone() == (900, 0)
+    db.commit()
+    assert balance_of(phone) == 900
+
+
+def test_batch_validation(client, monkeypatch):
+    assert batch(client, 'deposits', 'delete', [1]).status_code == 400
+    assert batch(client, 'deposits', 'approve', []).status_code == 400
+    assert batch(client, 'deposits', 'approve', ['1']).status_code == 400
+    assert batch(client, 'deposits', 'approve', [True]).status_code == 400
+    monkeypatch.setattr(server, 'ADMIN_BATCH_MAX_IDS', 2)
+    assert batch(client, 'withdraws', 'reject', [1, 2, 3]).status_code == 400
@@ -0,0 +1,28 @@
+import server
+
+
+def test_pending_deposits_page_through_next_cursor(client):
+    for i in range(5):
+        response = client.post('/request_deposit', json={
+            'phone_number': f'2268500000{i}', 'amount': 100 + i, 'transaction_proof': 'OM1'
+        })
+        assert response.status_code == 201
+    
+    # Suivre next_cursor comme le bouton « Page suivante » de la page d'administration
+    seen, before = [], None
+    while True:
+        query = {'limit': 2}
+        if before:
+            query['before'] = before
+        data = client.get('/admin/deposits', query_string=query).get_json()['data']
+        assert data['count'] <= 2
+        seen += [d['id'] for d in data['deposits']]
+        before = data['next_cursor']
+        if before is None:
+            break
+    
+    expected = [row[0] for row in server.get_db().execute(
+        "SELECT id FROM deposit_requests WHERE status = 'pending' ORDER BY created_at DESC, id DESC"
+    )]
+    assert seen == expected
+    assert len(expected) >= 5
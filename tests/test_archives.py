@@ -0,0 +1,76 @@
+import server
+
+
+def add(client, phone, kind, amount, date):
+    if kind == 'income':
+        body = {'phone_number': phone, 'amount': amount, 'source': 'Salaire', 'date': date}
+    else:
+        body = {'phone_number': phone, 'amount': amount, 'category': 'Loyer', 'date': date}
+    assert client.post(f'/add_{kind}', json=body).status_code == 201
+
+
+def hot_rows(user_id, month):
+    start, end = server.month_bounds(month)
+    return server.get_db().execute(
+        "SELECT COUNT(*) FROM transactions WHERE user_id = ? AND date >= ? AND date < ?", (user_id, start, end)
+    ).fetchone()[0]
+
+
+def checkpoint(user_id):
+    row = server.get_db().execute("SELECT balance FROM ledger_checkpoints WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def user_drifts(user_id):
+    return [d for d in server.find_balance_drifts(server.get_db().cursor()) if d['user_id'] == user_id]
+
+
+# Chaque test archive un mois que les autres tests n'utilisent pas (base de session partagée)
+
+def test_archive_month_moves_rows_and_carries_balance(client, create_user, balance_of):
+    phone = '22678000001'
+    user_id = create_user(phone)
+    add(client, phone, 'income', 1000, '2023-03-05')
+    add(client, phone, 'expense', 300, '2023-03-20')
+    add(client, phone, 'income', 50, '2023-05-01')
+    
+    moved = server.archive_month(server.get_db(), '2023-03')
+    
+    assert moved['transactions'] == 2
+    assert hot_rows(user_id, '2023-03') == 0
+    assert hot_rows(user_id, '2023-05') == 1
+    archive = server.open_archive(server.archive_path('2023-03'))
+    assert archive.execute(
+        "SELECT type, amount FROM transactions WHERE user_id = ? ORDER BY date", (user_id,)
+    ).fetchall() == [('income', 1000), ('expense', 300)]
+    archive.close()
+    
+    # Le solde des lignes archivées est reporté: le solde affiché et le contrôle ne changent pas
+    assert checkpoint(user_id) == 700
+    assert balance_of(phone) == 750
+    assert user_drifts(user_id) == []
+    
+    # Relancer l'archivage du même mois ne reporte rien deux fois
+    assert server.archive_month(server.get_db(), '2023-03')['transactions'] == 0
+    assert checkpoint(user_id) == 700
+    assert user_drifts(user_id) == []
+
+
+def test_history_with_archives_stitches_hot_and_archived_rows(client, create_user):
+    phone = '22678000002'
+    create_user(phone)
+    for amount, date in ((1, '2023-04-10'), (2, '2023-04-20'), (3, '2023-06-01'), (4, '2023-06-02')):
+        add(client, phone, 'income', amount, date)
+    server.archive_month(server.get_db(), '2023-04')
+    
+    def amounts(query):
+        data = client.get(f'/get_balance/{phone}?{query}').get_json()['data']
+        return [t['amount'] for t in data['transactions']], data.get('next_cursor')
+    
+    assert amounts('') == ([4, 3], None)
+    assert amounts('archive=1') == ([4, 3, 2, 1], None)
+    
+    # Pagination à cheval sur la base chaude et l'archive
+    first_page, cursor = amounts('archive=1&limit=3')
+    assert first_page == [4, 3, 2]
+    assert amounts(f'archive=1&limit=3&before={cursor}') == ([1], None)
@@ -0,0 +1,15 @@
+from conftest import run_in_other_process
+
+
+def test_displayed_balance_sees_writes_from_other_processes(client, create_user):
+    phone = '22671000001'
+    user_id = create_user(phone)
+    assert client.get(f'/get_balance/{phone}?fields=balance').get_json()['data']['balance'] == 0
+    assert client.get(f'/stats/{phone}').get_json()['data']['balance'] == 0
+    
+    run_in_other_process(f'''
+        server.run_write(lambda c: server.record_transaction(c, {user_id}, 'income', 5000, 'Salaire', '', '2025-01-10 10:00:00'))
+    ''')
+    
+    assert client.get(f'/get_balance/{phone}?fields=balance').get_json()['data']['balance'] == 5000
+    assert client.get(f'/stats/{phone}').get_json()['data']['balance'] == 5000
@@ -0,0 +1,41 @@
+import server
+
+
+def test_bulk_reports_each_row_and_routes_unknown_incomes(client, create_user, balance_of):
+    known, unknown = '22680000001', '22680000002'
+    create_user(known)
+    
+    response = client.post('/transactions/bulk', json={'transactions': [
+        {'phone_number': known, 'type': 'income', 'amount': 1000, 'source': 'Salaire'},
+        {'phone_number': f'+{known}', 'type': 'expense', 'amount': 250, 'category': 'Loyer'},
+        {'phone_number': unknown, 'type': 'income', 'amount': 400, 'source': 'Commerce'},
+        {'phone_number': unknown, 'type': 'expense', 'amount': 50, 'category': 'Loyer'},
+        {'phone_number': known, 'type': 'gift', 'amount': 10, 'category': 'x'},
+        {'phone_number': known, 'type': 'income', 'amount': 10.5, 'source': 'Salaire'},
+        {'phone_number': '12345', 'type': 'income', 'amount': 10, 'source': 'Salaire'},
+        'pas une ligne',
+    ]})
+    
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert (data['inserted'], data['pending'], data['errors']) == (2, 1, 5)
+    assert [r['status'] for r in data['results']] == [
+        'success', 'success', 'pending', 'error', 'error', 'error', 'error', 'error'
+    ]
+    assert [r['index'] for r in data['results']] == list(range(8))
+    assert data['results'][3]['message'] == 'Aucun utilisateur trouvé avec ce numéro de téléphone'
+    assert data['results'][6]['message'] == server.INVALID_PHONE_NUMBER_MESSAGE
+    assert balance_of(known) == 750
+    
+    # Le revenu d'un numéro inconnu attend l'inscription, puis est crédité
+    pending = client.get(f'/pending_deposits/{unknown}').get_json()['data']
+    assert [d['amount'] for d in pending['pending_deposits']] == [400]
+    create_user(unknown)
+    assert balance_of(unknown) == 400
+
+
+def test_bulk_rejects_an_empty_or_oversized_batch(client, monkeypatch):
+    assert client.post('/transactions/bulk', json={'transactions': []}).status_code == 400
+    monkeypatch.setattr(server, 'BULK_MAX_ROWS', 1)
+    rows = [{'phone_number': '22680000003', 'type': 'income', 'amount': 1, 'source': 'x'}] * 2
+    assert client.post('/transactions/bulk', json={'transactions': rows}).status_code == 400
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+import server
+
+
+def test_requests_reuse_pooled_connections(app, create_user, monkeypatch):
+    create_user('22683000001')
+    opened = []
+    connect = server._connect
+    monkeypatch.setattr(server, '_connect', lambda path: opened.append(path) or connect(path))
+    
+    # Chaque requête dans son propre thread, comme autant de greenlets successives
+    def request_balance():
+        assert app.test_client().get('/get_balance/22683000001').status_code == 200
+    
+    for _ in range(5):
+        thread = threading.Thread(target=request_balance)
+        thread.start()
+        thread.join()
+    
+    assert len(opened) <= 1
+
+
+def test_pool_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'DB_BUSY_TIMEOUT_MS', 50)
+    pool = server.ConnectionPool(str(tmp_path / 'pool.db'), 2)
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(server.sqlite3.OperationalError):
+        pool.acquire()
+    
+    first.execute("BEGIN")
+    pool.release(first)
+    reused = pool.acquire()
+    assert reused is first and not reused.in_transaction
+    pool.discard(second)
+    pool.discard(reused)
+
+
+def test_long_poll_waits_without_a_connection(client, create_user, monkeypatch):
+    create_user('22683000002')
+    held = []
+    
+    def wait(subscriber, timeout):
+        held.append(dict(getattr(server._local, 'connections', None) or {}))
+        return []
+    
+    monkeypatch.setattr(server.Subscriber, 'wait', wait)
+    response = client.get('/events/22683000002?poll=1&timeout=1')
+    
+    assert response.status_code == 200
+    assert held == [{}]
+
+
+def test_gevent_connections_wait_for_the_lock_cooperatively(tmp_path, monkeypatch):
+    path = str(tmp_path / 'busy.db')
+    writer = server._connect(path)
+    monkeypatch.setattr(server, '_gevent_patched', lambda: True)
+    waiting = server._connect(path)
+    assert waiting.execute("PRAGMA busy_timeout").fetchone() == (0,)
+    
+    writer.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.1, writer.commit)
+    release.start()
+    waiting.execute("BEGIN IMMEDIATE")
+    waiting.commit()
+    release.join()
+    writer.close()
+    waiting.close()
@@ -0,0 +1,36 @@
+from conftest import run_in_other_process
+
+
+def test_balance_etag_changes_after_write_from_other_process(client, create_user):
+    phone = '22672000001'
+    user_id = create_user(phone)
+    
+    first = client.get(f'/get_balance/{phone}')
+    etag = first.headers['ETag']
+    assert client.get(f'/get_balance/{phone}', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/stats/{phone}', headers={'If-None-Match': etag}).status_code == 304
+    
+    run_in_other_process(f'''
+        server.run_write(lambda c: server.record_transaction(c, {user_id}, 'income', 700, 'Salaire', '', '2025-01-10 10:00:00'))
+    ''')
+    
+    response = client.get(f'/get_balance/{phone}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['data']['balance'] == 700
+    assert client.get(f'/stats/{phone}', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_pending_deposits_etag_changes_after_write_from_other_process(client):
+    phone = '22672000002'
+    etag = client.get(f'/pending_deposits/{phone}').headers['ETag']
+    
+    run_in_other_process(f'''
+        server.run_write(lambda c: c.execute(
+            "INSERT INTO pending_deposits (phone_number, phone_key, amount, source, date) VALUES ('+{phone}', {phone}, 10, 'x', '2025-01-01')"
+        ))
+    ''')
+    
+    response = client.get(f'/pending_deposits/{phone}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['data']['count'] == 1
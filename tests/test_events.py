@@ -0,0 +1,43 @@
+import json
+
+import server
+
+
+def test_writes_prune_expired_events_without_subscribers(client, create_user, monkeypatch):
+    phone = '22676000001'
+    user_id = create_user(phone)
+    client.post('/add_income', json={'phone_number': phone, 'amount': 50, 'source': 'Salaire'})
+    # Tous les événements déjà publiés ont dépassé la rétention
+    db = server.get_db()
+    db.execute("UPDATE events SET created_at = '2020-01-01 00:00:00'")
+    db.commit()
+    assert db.execute("SELECT COUNT(*) FROM events").fetchone()[0] > 0
+    
+    monkeypatch.setattr(server, '_events_pruned_at', 0.0)
+    response = client.post('/add_income', json={'phone_number': phone, 'amount': 100, 'source': 'Salaire'})
+    assert response.status_code == 201
+    
+    assert db.execute("SELECT COUNT(*) FROM events WHERE created_at < '2021-01-01'").fetchone()[0] == 0
+    assert db.execute(
+        "SELECT COUNT(*) FROM events WHERE channel = ?", (server.user_channel(user_id),)
+    ).fetchone()[0] > 0
+    assert server._event_broker is None or not server._event_broker.subscribers
+
+
+def test_transaction_events_carry_the_balance_version_of_stats(client, create_user):
+    phone = '22676000002'
+    user_id = create_user(phone)
+    response = client.post('/add_income', json={'phone_number': phone, 'amount': 100, 'source': 'Salaire'})
+    assert response.status_code == 201
+    
+    stats = client.get(f'/stats/{phone}').get_json()['data']
+    assert stats['transaction_count'] == 1
+    
+    db = server.get_db()
+    transaction_id = db.execute("SELECT id FROM transactions WHERE user_id = ?", (user_id,)).fetchone()[0]
+    payloads = [json.loads(row[0]) for row in db.execute(
+        "SELECT payload FROM events WHERE channel = ? AND type = 'transaction'", (server.user_channel(user_id),)
+    )]
+    assert [p['id'] for p in payloads] == [transaction_id]
+    # La page ne recompte pas une notification déjà incluse dans les totaux rechargés
+    assert payloads[0]['version'] == stats['version']
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+import server
+
+
+def submit_together(writer, jobs):
+    """Soumettre les écritures depuis des threads distincts: [(résultat, erreur)] dans l'ordre."""
+    outcomes = [None] * len(jobs)
+    
+    def submit(index, job):
+        try:
+            outcomes[index] = (writer.submit(job), None)
+        except Exception as e:
+            outcomes[index] = (None, e)
+    
+    threads = [threading.Thread(target=submit, args=(i, job)) for i, job in enumerate(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def insert_user(phone_number):
+    def job(c):
+        c.execute("INSERT INTO users (phone_number, phone_key, name) VALUES (?, ?, 'Test')",
+                  (f'+{phone_number}', int(phone_number)))
+        return c.lastrowid
+    return job
+
+
+def user_exists(phone_number):
+    db = server.get_db()
+    exists = db.execute("SELECT 1 FROM users WHERE phone_key = ?", (int(phone_number),)).fetchone() is not None
+    db.commit()
+    return exists
+
+
+@pytest.fixture
+def writer(app):
+    # Délai long: les écritures soumises ensemble partent dans le même lot
+    writer = server.GroupCommitWriter(max_batch=3, max_delay_ms=2000)
+    batches = []
+    commit_batch = writer._commit_batch
+    
+    def recording_commit_batch(conn, batch):
+        batches.append(len(batch))
+        commit_batch(conn, batch)
+    
+    writer._commit_batch = recording_commit_batch
+    writer.batches = batches
+    return writer
+
+
+def test_jobs_submitted_together_share_one_commit(writer):
+    phones = ['22682000001', '22682000002', '22682000003']
+    outcomes = submit_together(writer, [insert_user(phone) for phone in phones])
+    
+    assert writer.batches == [3]
+    assert all(error is None and isinstance(result, int) for result, error in outcomes)
+    assert all(user_exists(phone) for phone in phones)
+
+
+def test_failed_job_is_rolled_back_alone_and_raised_to_its_caller(writer):
+    def failing_job(c):
+        insert_user('22682000005')(c)
+        raise ValueError('refusé')
+    
+    outcomes = submit_together(writer, [insert_user('22682000004'), failing_job, insert_user('22682000006')])
+    
+    assert writer.batches == [3]
+    assert isinstance(outcomes[1][1], ValueError)
+    assert outcomes[0][1] is None and outcomes[2][1] is None
+    assert user_exists('22682000004') and user_exists('22682000006')
+    assert not user_exists('22682000005')
+
+
+def test_batch_failure_is_raised_to_every_caller(writer):
+    # Une écriture qui termine elle-même la transaction fait échouer tout le lot
+    def breaking_job(c):
+        c.connection.rollback()
+    
+    outcomes = submit_together(writer, [insert_user('22682000007'), breaking_job, insert_user('22682000008')])
+    
+    assert all(error is not None for _, error in outcomes)
+    assert not user_exists('22682000007') and not user_exists('22682000008')
+
+
+def test_endpoints_write_through_the_group_writer(client, create_user, balance_of, monkeypatch):
+    monkeypatch.setattr(server, 'GROUP_COMMIT', True)
+    phone = '22682000009'
+    create_user(phone)
+    
+    response = client.post('/add_income', json={'phone_number': phone, 'amount': 800, 'source': 'Salaire'})
+    
+    assert response.status_code == 201
+    assert server._group_writer is not None
+    assert balance_of(phone) == 800
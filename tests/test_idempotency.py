@@ -0,0 +1,66 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import server
+
+
+def test_retried_transfer_debits_once(client, create_user, balance_of):
+    sender, recipient = '22674000001', '22674000002'
+    create_user(sender)
+    create_user(recipient)
+    response = client.post('/add_income', json={'phone_number': sender, 'amount': 1000, 'source': 'Salaire'})
+    assert response.status_code == 201
+    
+    payload = {'sender_phone': sender, 'recipient_phone': recipient, 'amount': 300}
+    headers = {'Idempotency-Key': 'transfer-retry-1'}
+    first = client.post('/transfer', json=payload, headers=headers)
+    second = client.post('/transfer', json=payload, headers=headers)
+    
+    assert first.status_code == second.status_code == 201
+    assert second.headers.get('Idempotent-Replayed') == 'true'
+    assert second.get_json() == first.get_json()
+    assert balance_of(sender) == 700
+    assert balance_of(recipient) == 300
+
+
+def test_abandoned_reservation_stops_answering_409(client, create_user, balance_of):
+    phone = '22674000003'
+    create_user(phone)
+    payload = {'phone_number': phone, 'amount': 500, 'source': 'Salaire'}
+    headers = {'Idempotency-Key': 'income-abandoned-1'}
+    assert client.post('/add_income', json=payload, headers=headers).status_code == 201
+    
+    # Réponse jamais enregistrée (processus arrêté entre l'écriture et l'enregistrement)
+    db = server.get_db()
+    db.execute("UPDATE idempotency_keys SET status_code = NULL, response = NULL WHERE key = 'income-abandoned-1'")
+    db.commit()
+    assert client.post('/add_income', json=payload, headers=headers).status_code == 409
+    
+    db.execute(
+        "UPDATE idempotency_keys SET reserved_at = ? WHERE key = 'income-abandoned-1'",
+        (datetime.now() - timedelta(seconds=server.IDEMPOTENCY_IN_FLIGHT_TIMEOUT + 1),)
+    )
+    db.commit()
+    retry = client.post('/add_income', json=payload, headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers.get('Idempotent-Replayed') == 'true'
+    assert balance_of(phone) == 500
+
+
+def test_failed_response_store_keeps_the_response(client, create_user, balance_of, monkeypatch):
+    phone = '22674000004'
+    create_user(phone)
+    run_write = server.run_write
+    calls = []
+    
+    def busy_after_first_write(job):
+        calls.append(job)
+        if len(calls) > 1:
+            raise sqlite3.OperationalError('database is locked')
+        return run_write(job)
+    
+    monkeypatch.setattr(server, 'run_write', busy_after_first_write)
+    payload = {'phone_number': phone, 'amount': 500, 'source': 'Salaire'}
+    response = client.post('/add_income', json=payload, headers={'Idempotency-Key': 'income-busy-1'})
+    assert response.status_code == 201
+    assert balance_of(phone) == 500
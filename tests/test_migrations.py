@@ -0,0 +1,123 @@
+import os
+import sqlite3
+
+import pytest
+
+import server
+from conftest import migrate_to
+
+
+def insert_user(conn, phone_number, name='A'):
+    return conn.execute("INSERT INTO users (phone_number, name) VALUES (?, ?)", (phone_number, name)).lastrowid
+
+
+# 4. Montants en entiers
+
+def test_integer_amounts_refuses_fractional_amounts(conn):
+    migrate_to(conn, 3)
+    user_id = insert_user(conn, '22670000001')
+    conn.executemany(
+        "INSERT INTO transactions (user_id, type, amount, category, date) VALUES (?, ?, ?, 'x', '2025-01-01')",
+        [(user_id, 'income', 100.6), (user_id, 'expense', 10.0)]
+    )
+    conn.commit()
+    
+    with pytest.raises(RuntimeError, match='100.6'):
+        server.migrate_db(conn)
+    
+    assert server.get_schema_version(conn) == 3
+    assert conn.execute("SELECT amount FROM transactions ORDER BY id").fetchall() == [(100.6,), (10.0,)]
+
+
+def test_integer_amounts_converts_whole_amounts(conn):
+    migrate_to(conn, 3)
+    user_id = insert_user(conn, '22670000001')
+    conn.executemany(
+        "INSERT INTO transactions (user_id, type, amount, category, date) VALUES (?, ?, ?, 'x', '2025-01-01')",
+        [(user_id, 'income', 1500.0), (user_id, 'expense', 200.0)]
+    )
+    conn.execute("INSERT INTO deposit_requests (phone_number, amount, transaction_proof) VALUES ('22670000002', 300.0, 'p')")
+    conn.commit()
+    
+    server.migrate_db(conn)
+    
+    assert conn.execute("SELECT amount, typeof(amount) FROM transactions ORDER BY id").fetchall() == [
+        (1500, 'integer'), (200, 'integer')
+    ]
+    assert conn.execute("SELECT amount, typeof(amount) FROM deposit_requests").fetchall() == [(300, 'integer')]
+    assert conn.execute("SELECT balance FROM balances WHERE user_id = ?", (user_id,)).fetchone() == (1300,)
+
+
+# 11. Numéros normalisés
+
+def test_phone_keys_merges_duplicate_users(conn):
+    migrate_to(conn, 10)
+    keep = insert_user(conn, '+22670000001', 'A')
+    duplicate = insert_user(conn, '22670000001', 'A bis')
+    conn.executemany("INSERT INTO balances (user_id, balance) VALUES (?, 0)", [(keep,), (duplicate,)])
+    c = conn.cursor()
+    server.record_transaction(c, keep, 'income', 1000, 'Salaire', '', '2025-01-10 10:00:00')
+    server.record_transaction(c, duplicate, 'income', 500, 'Salaire', '', '2025-01-11 10:00:00')
+    server.record_transaction(c, duplicate, 'expense', 100, 'Food', '', '2025-01-12 10:00:00')
+    conn.execute("INSERT INTO withdraw_requests (user_id, amount) VALUES (?, 50)", (duplicate,))
+    conn.execute("UPDATE balances SET held = 50 WHERE user_id = ?", (duplicate,))
+    conn.execute("INSERT INTO pending_deposits (phone_number, amount, source, date) VALUES (' 22670000002', 70, 'x', '2025-01-01')")
+    conn.commit()
+    
+    server.migrate_db(conn)
+    
+    assert conn.execute("SELECT id, phone_number, phone_key FROM users").fetchall() == [(keep, '+22670000001', 22670000001)]
+    assert conn.execute("SELECT user_id, balance, held FROM balances").fetchall() == [(keep, 1400, 50)]
+    assert conn.execute("SELECT DISTINCT user_id FROM transactions").fetchall() == [(keep,)]
+    assert conn.execute("SELECT user_id FROM withdraw_requests").fetchall() == [(keep,)]
+    assert conn.execute(
+        "SELECT type, total, count FROM ledger_rollups WHERE user_id = ? AND period_kind = 'month' ORDER BY type", (keep,)
+    ).fetchall() == [('expense', 100, 1), ('income', 1500, 2)]
+    assert conn.execute("SELECT phone_number, phone_key FROM pending_deposits").fetchall() == [('+22670000002', 22670000002)]
+    assert server.find_balance_drifts(conn.cursor()) == []
+
+
+def test_phone_keys_merges_archived_rows(conn):
+    migrate_to(conn, 10)
+    keep = insert_user(conn, '+22670000003', 'A')
+    duplicate = insert_user(conn, '22670000003', 'A bis')
+    
+    # Mois déjà archivé pour le doublon: le solde reporté est dans ledger_checkpoints
+    os.makedirs(server.ARCHIVE_DIR)
+    archive = sqlite3.connect(':memory:')
+    archive.execute("ATTACH DATABASE ? AS archive", (server.archive_path('2024-06'),))
+    for sql in server.ARCHIVE_SCHEMA:
+        archive.execute(sql)
+    archive.execute(
+        "INSERT INTO archive.transactions (id, user_id, type, amount, category, date) "
+        "VALUES (1, ?, 'income', 800, 'Salaire', '2024-06-10 10:00:00')", (duplicate,)
+    )
+    archive.execute(
+        "INSERT INTO archive.withdraw_requests (id, user_id, amount, status, created_at) "
+        "VALUES (1, ?, 300, 'approved', '2024-06-11 10:00:00')", (duplicate,)
+    )
+    archive.commit()
+    archive.close()
+    conn.executemany("INSERT INTO balances (user_id, balance) VALUES (?, ?)", [(keep, 0), (duplicate, 800)])
+    conn.execute("INSERT INTO ledger_checkpoints (user_id, balance) VALUES (?, 800)", (duplicate,))
+    conn.commit()
+    
+    server.migrate_db(conn)
+    
+    archive = server.open_archive(server.archive_path('2024-06'))
+    assert archive.execute("SELECT user_id FROM transactions").fetchall() == [(keep,)]
+    assert archive.execute("SELECT user_id FROM withdraw_requests").fetchall() == [(keep,)]
+    archive.close()
+    assert conn.execute(
+        "SELECT user_id, period, total FROM ledger_rollups WHERE period_kind = 'month'"
+    ).fetchall() == [(keep, '2024-06', 800)]
+    assert server.find_balance_drifts(conn.cursor()) == []
+
+
+def test_phone_key_normalization():
+    assert server.phone_key('+22670000001') == server.phone_key('22670000001') == 22670000001
+    assert server.phone_key(' 22670000001 ') == 22670000001
+    assert server.phone_key('2267000000') is None
+    assert server.phone_key('226700000011') is None
+    assert server.phone_key(22670000001) is None
+    assert server.format_phone_number(22670000001) == '+22670000001'
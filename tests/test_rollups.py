@@ -0,0 +1,27 @@
+import server
+from conftest import migrate_to
+
+
+def test_week_crossing_new_year_is_one_period(client, create_user):
+    phone = '22673000001'
+    create_user(phone)
+    for date in ('2024-12-30', '2025-01-01', '2025-01-05', '2025-01-06'):
+        response = client.post('/add_income', json={'phone_number': phone, 'amount': 100, 'source': 'x', 'date': date})
+        assert response.status_code == 201
+    
+    periods = client.get(f'/stats/{phone}?period=week').get_json()['data']['periods']
+    assert [(p['period'], p['income']) for p in periods] == [('2024-12-30', 300), ('2025-01-06', 100)]
+
+
+def test_week_periods_migration_rewrites_old_keys(conn):
+    migrate_to(conn, 11)
+    c = conn.cursor()
+    user_id = conn.execute("INSERT INTO users (phone_number, phone_key, name) VALUES ('+22673000002', 22673000002, 'A')").lastrowid
+    conn.execute("INSERT INTO balances (user_id, balance) VALUES (?, 0)", (user_id,))
+    server.record_transaction(c, user_id, 'income', 100, 'x', '', '2024-12-30 10:00:00')
+    conn.execute("UPDATE ledger_rollups SET period = '2024-W53' WHERE period_kind = 'week'")
+    conn.commit()
+    
+    server.migrate_db(conn)
+    
+    assert conn.execute("SELECT period FROM ledger_rollups WHERE period_kind = 'week'").fetchall() == [('2024-12-30',)]
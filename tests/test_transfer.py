@@ -0,0 +1,81 @@
+import server
+
+
+def transfer(client, sender, recipient, amount, headers=None):
+    return client.post('/transfer', json={'sender_phone': sender, 'recipient_phone': recipient, 'amount': amount},
+                       headers=headers)
+
+
+def funded_pair(client, create_user, sender, recipient, amount=1000):
+    create_user(sender)
+    create_user(recipient)
+    response = client.post('/add_income', json={'phone_number': sender, 'amount': amount, 'source': 'Salaire'})
+    assert response.status_code == 201
+
+
+def test_transfer_debits_and_credits(client, create_user, balance_of):
+    sender, recipient = '22679000001', '22679000002'
+    funded_pair(client, create_user, sender, recipient)
+    
+    response = transfer(client, sender, recipient, 400)
+    
+    assert response.status_code == 201
+    assert response.get_json()['data'] == {'sender_balance': 600, 'recipient_balance': 400}
+    assert balance_of(sender) == 600
+    assert balance_of(recipient) == 400
+    history = client.get(f'/get_balance/{recipient}').get_json()['data']['transactions']
+    assert history[0]['note'] == f'Transfert de +{sender}'
+
+
+def test_transfer_is_all_or_nothing(client, create_user, balance_of, monkeypatch):
+    sender, recipient = '22679000003', '22679000004'
+    funded_pair(client, create_user, sender, recipient)
+    record_transaction = server.record_transaction
+    
+    def fail_on_credit(c, user_id, type, *args):
+        if type == 'income':
+            raise RuntimeError('panne')
+        return record_transaction(c, user_id, type, *args)
+    
+    monkeypatch.setattr(server, 'record_transaction', fail_on_credit)
+    assert transfer(client, sender, recipient, 400).status_code == 500
+    
+    assert balance_of(sender) == 1000
+    assert balance_of(recipient) == 0
+
+
+def test_transfer_to_self_is_refused(client, create_user, balance_of):
+    phone = '22679000005'
+    create_user(phone)
+    client.post('/add_income', json={'phone_number': phone, 'amount': 1000, 'source': 'Salaire'})
+    
+    assert transfer(client, phone, f'+{phone}', 100).status_code == 400
+    assert balance_of(phone) == 1000
+
+
+def test_transfer_counts_withdrawal_holds(client, create_user, balance_of):
+    sender, recipient = '22679000006', '22679000007'
+    funded_pair(client, create_user, sender, recipient)
+    assert client.post('/request_withdraw', json={'phone_number': sender, 'amount': 700}).status_code == 201
+    
+    # Solde 1000, disponible 300
+    response = transfer(client, sender, recipient, 400)
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Solde insuffisant pour effectuer ce transfert'
+    assert transfer(client, sender, recipient, 300).status_code == 201
+    assert balance_of(sender) == 700
+    assert balance_of(recipient) == 300
+
+
+def test_refused_transfer_is_replayed_without_rechecking(client, create_user, balance_of):
+    sender, recipient = '22679000008', '22679000009'
+    funded_pair(client, create_user, sender, recipient, amount=100)
+    headers = {'Idempotency-Key': 'transfer-refused-1'}
+    
+    assert transfer(client, sender, recipient, 200, headers).status_code == 400
+    client.post('/add_income', json={'phone_number': sender, 'amount': 1000, 'source': 'Salaire'})
+    
+    replay = transfer(client, sender, recipient, 200, headers)
+    assert replay.status_code == 400
+    assert replay.headers.get('Idempotent-Replayed') == 'true'
+    assert balance_of(recipient) == 0
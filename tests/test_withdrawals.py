@@ -0,0 +1,101 @@
+import threading
+
+import server
+
+
+def balance_and_held(user_id):
+    db = server.get_db()
+    row = db.execute("SELECT balance, held FROM balances WHERE user_id = ?", (user_id,)).fetchone()
+    db.commit()
+    return row
+
+
+def pending_withdraw_id(user_id):
+    return server.get_db().execute(
+        "SELECT MAX(id) FROM withdraw_requests WHERE user_id = ? AND status = 'pending'", (user_id,)
+    ).fetchone()[0]
+
+
+def funded_user(client, create_user, phone, amount=1000):
+    user_id = create_user(phone)
+    response = client.post('/add_income', json={'phone_number': phone, 'amount': amount, 'source': 'Salaire'})
+    assert response.status_code == 201
+    return user_id
+
+
+def test_request_holds_the_amount_and_refuses_overdraw(client, create_user):
+    phone = '22677000001'
+    user_id = funded_user(client, create_user, phone)
+    
+    assert client.post('/request_withdraw', json={'phone_number': phone, 'amount': 600}).status_code == 201
+    assert balance_and_held(user_id) == (1000, 600)
+    
+    # Disponible: 1000 - 600 = 400
+    response = client.post('/request_withdraw', json={'phone_number': phone, 'amount': 500})
+    assert response.status_code == 400
+    assert balance_and_held(user_id) == (1000, 600)
+    assert client.post('/request_withdraw', json={'phone_number': phone, 'amount': 400}).status_code == 201
+    assert balance_and_held(user_id) == (1000, 1000)
+
+
+def test_reject_releases_the_hold(client, create_user):
+    phone = '22677000003'
+    user_id = funded_user(client, create_user, phone)
+    client.post('/request_withdraw', json={'phone_number': phone, 'amount': 600})
+    withdraw_id = pending_withdraw_id(user_id)
+    
+    assert client.post(f'/admin/reject_withdraw/{withdraw_id}').status_code == 200
+    assert balance_and_held(user_id) == (1000, 0)
+    assert client.post(f'/admin/reject_withdraw/{withdraw_id}').status_code == 409
+    assert balance_and_held(user_id) == (1000, 0)
+
+
+def test_approve_settles_the_hold(client, create_user, balance_of):
+    phone = '22677000004'
+    user_id = funded_user(client, create_user, phone)
+    client.post('/request_withdraw', json={'phone_number': phone, 'amount': 600})
+    withdraw_id = pending_withdraw_id(user_id)
+    
+    assert client.post(f'/admin/approve_withdraw/{withdraw_id}').status_code == 200
+    assert balance_and_held(user_id) == (400, 0)
+    assert balance_of(phone) == 400
+    assert server.find_balance_drifts(server.get_db().cursor()) == []
+
+
+def test_approve_refuses_when_balance_no_longer_covers(client, create_user):
+    phone = '22677000005'
+    user_id = funded_user(client, create_user, phone)
+    client.post('/request_withdraw', json={'phone_number': phone, 'amount': 600})
+    withdraw_id = pending_withdraw_id(user_id)
+    # Les dépenses ne tiennent pas compte des réservations
+    client.post('/add_expense', json={'phone_number': phone, 'amount': 700, 'category': 'Loyer'})
+    
+    response = client.post('/admin/withdraws/batch', json={'action': 'approve', 'ids': [withdraw_id]})
+    assert response.get_json()['data']['results'] == [{'id': withdraw_id, 'outcome': 'insufficient_balance'}]
+    assert client.post(f'/admin/approve_withdraw/{withdraw_id}').status_code == 409
+    # La demande reste en attente, sa réservation aussi
+    assert balance_and_held(user_id) == (300, 600)
+    assert pending_withdraw_id(user_id) == withdraw_id
+
+
+def test_concurrent_requests_cannot_overdraw(app, create_user, client):
+    phone = '22677000006'
+    user_id = funded_user(client, create_user, phone)
+    barrier = threading.Barrier(2)
+    statuses = []
+    
+    def request_withdraw():
+        with app.test_client() as thread_client:
+            barrier.wait()
+            response = thread_client.post('/request_withdraw', json={'phone_number': phone, 'amount': 700})
+            statuses.append(response.status_code)
+        server.close_db()
+    
+    threads = [threading.Thread(target=request_withdraw) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert sorted(statuses) == [201, 400]
+    assert balance_and_held(user_id) == (1000, 700)